@@ -2,23 +2,21 @@ import pandas as pd
 import os
 import time
 from logger_setup import logger
+from background_save import start_background_save, finish_background_save
+from etl_automation import add_calendar_features, atomic_output
+from metrics_store import (start_run, record_stage, finish_run, file_size, load_stage_metrics,
+                           stage_duration_trends, stage_success_counts)
+from profiling import profile_stage, print_stage_profiles
 import matplotlib.pyplot as plt
-from datetime import datetime
 
-# Global variables for monitoring
-metrics = {
-    'load_time': [],
-    'clean_time': [],
-    'transform_time': [],
-    'dates': [],
-    'load_success': 0,
-    'clean_success': 0,
-    'transform_success': 0
-}
+# Each stage logs its own stage event through record_stage, so profile_stage
+# is told not to log a second one
 
 # Function to load data
+@profile_stage('load', log_event=False)
 def load_data(filepath):
-    start_time = time.time()
+    start_time = time.perf_counter()
+    df = None
     try:
         directory = os.path.dirname(filepath)
         if directory:
@@ -35,7 +33,6 @@ def load_data(filepath):
 
         if df is not None:
             logger.info("Data loaded successfully.")
-            metrics['load_success'] += 1
         else:
             logger.warning("Warning: Loaded data is None.")
         return df
@@ -43,11 +40,15 @@ def load_data(filepath):
         logger.error(f"Error loading data: {e}")
         return None
     finally:
-        metrics['load_time'].append(time.time() - start_time)
+        record_stage('load', time.perf_counter() - start_time, success=df is not None,
+                     rows=None if df is None else len(df), bytes_read=file_size(filepath))
 
 # Function for cleaning the data
+@profile_stage('clean', log_event=False)
 def clean_data(df):
-    start_time = time.time()
+    start_time = time.perf_counter()
+    rows_in = len(df)
+    success = False
     try:
         df.dropna(inplace=True)
         df['Transaction ID'] = df['Transaction ID'].astype(int)
@@ -60,14 +61,16 @@ def clean_data(df):
         df['Total Amount'] = df['Total Amount'].astype(float)
         df = df[(df['Quantity'] > 0) & (df['Price per Unit'] > 0)]
         logger.info("Data cleaned successfully.")
-        metrics['clean_success'] += 1
+        success = True
     except Exception as e:
         logger.error(f"Error cleaning data: {e}")
     finally:
-        metrics['clean_time'].append(time.time() - start_time)
+        record_stage('clean', time.perf_counter() - start_time, success=success, rows=len(df),
+                     rows_in=rows_in)
         return df
 
 # Function to validate cleaned data
+@profile_stage('validate_cleaned', log_event=False)
 def validate_cleaned_data(df):
     try:
         assert df['Transaction ID'].dtype == int, "Transaction Id should be integer"
@@ -81,44 +84,45 @@ def validate_cleaned_data(df):
         return False
 
 # Function to save cleaned data
+@profile_stage('save_cleaned', log_event=False)
 def save_cleaned_data(df, cleaned_filepath):
+    start_time = time.perf_counter()
+    success = False
     try:
-        df.to_pickle(cleaned_filepath)
+        with atomic_output(cleaned_filepath) as temp_path:
+            df.to_pickle(temp_path)
         logger.info("Cleaned data saved successfully.")
+        success = True
     except Exception as e:
         logger.error(f"Error saving cleaned data: {e}")
+    finally:
+        record_stage('save_cleaned', time.perf_counter() - start_time, success=success,
+                     rows=len(df), rows_in=len(df), bytes_written=file_size(cleaned_filepath))
+    return success
 
 # Function for transforming the data
+@profile_stage('transform', log_event=False)
 def transform_data(df):
-    start_time = time.time()
+    start_time = time.perf_counter()
+    success = False
     if df is None:
         logger.error("Error: DataFrame is None. Transformation skipped.")
         return None
     try:
-        df['Day of Week'] = df['Date'].dt.day_name()
-        df['Month'] = df['Date'].dt.month
-
-        def get_season(month):
-            if month in [12, 1, 2]:
-                return 'Winter'
-            elif month in [3, 4, 5]:
-                return 'Spring'
-            elif month in [6, 7, 8]:
-                return 'Summer'
-            else:
-                return 'Fall'
-
-        df['Season'] = df['Month'].apply(get_season)
+        # Add 'Day of Week', 'Month' and 'Season' columns based on 'Date'
+        add_calendar_features(df)
         df['Revenue'] = df['Quantity'] * df['Price per Unit']
         logger.info("Data transformed successfully.")
-        metrics['transform_success'] += 1
+        success = True
     except Exception as e:
         logger.error(f"Error transforming data: {e}")
     finally:
-        metrics['transform_time'].append(time.time() - start_time)
+        record_stage('transform', time.perf_counter() - start_time, success=success, rows=len(df),
+                     rows_in=len(df))
         return df
 
 # Function to validate transformed data
+@profile_stage('validate_transformed', log_event=False)
 def validate_transformed_data(df):
     try:
         assert 'Revenue' in df.columns, "Revenue column is missing"
@@ -131,27 +135,35 @@ def validate_transformed_data(df):
         return False
 
 # Function to save transformed data
+@profile_stage('save_transformed', log_event=False)
 def save_transformed_data(df, transformed_filepath):
+    start_time = time.perf_counter()
+    success = False
     try:
-        df.to_pickle(transformed_filepath)
+        with atomic_output(transformed_filepath) as temp_path:
+            df.to_pickle(temp_path)
         logger.info("Transformed data saved successfully.")
+        success = True
     except Exception as e:
         logger.error(f"Error saving transformed data: {e}")
+    finally:
+        record_stage('save_transformed', time.perf_counter() - start_time, success=success,
+                     rows=len(df), rows_in=len(df), bytes_written=file_size(transformed_filepath))
+    return success
 
 # Function to print monitoring results
-def print_monitoring_results():
+def print_monitoring_results(run_id):
     logger.info("Monitoring Results:")
-    logger.info(f"Load Times: {metrics['load_time']}")
-    logger.info(f"Clean Times: {metrics['clean_time']}")
-    logger.info(f"Transform Times: {metrics['transform_time']}")
-    logger.info(f"Load Successes: {metrics['load_success']}")
-    logger.info(f"Clean Successes: {metrics['clean_success']}")
-    logger.info(f"Transform Successes: {metrics['transform_success']}")
+    for stage in load_stage_metrics(run_id=run_id).itertuples():
+        status = "succeeded" if stage.success else "failed"
+        logger.info(f"{stage.stage}: {status} in {stage.duration:.3f}s, rows={stage.rows}, "
+                    f"bytes read={stage.bytes_read}, bytes written={stage.bytes_written}, "
+                    f"peak memory={stage.peak_memory_mb:.1f} MB")
 
 # Functions to plot visualizations
-def plot_success_rates(metrics):
+def plot_success_rates(success_counts):
     categories = ['Load Success', 'Clean Success', 'Transform Success']
-    success_counts = [metrics['load_success'], metrics['clean_success'], metrics['transform_success']]
+    success_counts = [success_counts['load'], success_counts['clean'], success_counts['transform']]
     
     plt.bar(categories, success_counts, color=['blue', 'orange', 'green'])
     plt.title('Success Rates of ETL Pipeline')
@@ -170,28 +182,16 @@ def plot_success_rates(metrics):
     
     return success_rates_path
 
-def plot_trends(metrics):
-    # Check if metrics lists are empty
-    if not metrics['dates']:
-        logger.error("The 'dates' list is empty, cannot plot trends.")
+def plot_trends(trends):
+    # Check if any runs have been recorded
+    if trends.empty:
+        logger.error("No runs recorded in the metrics store, cannot plot trends.")
         return None
 
-    # Check for consistency in lengths
-    metrics_lengths = {
-        'load_time': len(metrics['load_time']),
-        'clean_time': len(metrics['clean_time']),
-        'transform_time': len(metrics['transform_time']),
-    }
-
-    for metric, length in metrics_lengths.items():
-        if length != len(metrics['dates']):
-            logger.error(f"Mismatch in lengths: {metric} has {length} entries but dates has {len(metrics['dates'])}.")
-            return None
-
-    # Proceed with plotting
-    plt.plot(metrics['dates'], metrics['load_time'], label='Load Time', marker='o')
-    plt.plot(metrics['dates'], metrics['clean_time'], label='Clean Time', marker='o')
-    plt.plot(metrics['dates'], metrics['transform_time'], label='Transform Time', marker='o')
+    # Runs where a stage failed have no duration for it and leave a gap
+    plt.plot(trends.index, trends['load'], label='Load Time', marker='o')
+    plt.plot(trends.index, trends['clean'], label='Clean Time', marker='o')
+    plt.plot(trends.index, trends['transform'], label='Transform Time', marker='o')
 
     plt.title('ETL Process Time Trends')
     plt.xlabel('Date')
@@ -223,49 +223,40 @@ def generate_report(report_filepath, success_rates_path, trends_path):
         f.write(f"<img src='{trends_path}' alt='Trends'>\n")
         f.write("</body></html>")
 
-def main(input_filepath, cleaned_filepath, transformed_filepath, report_filepath):
-    start_time = time.time()
+def main(input_filepath, cleaned_filepath, transformed_filepath, report_filepath, persist_cleaned=True):
+    # Each stage records its own metrics against this run
+    run_id = start_run('analytics')
+    status = 'failed'
     df = load_data(input_filepath)
     if df is not None:
-        metrics['load_time'].append(time.time() - start_time)
-        metrics['dates'].append(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))  # Date after load success
-
         cleaned_df = clean_data(df)
         
         if validate_cleaned_data(cleaned_df):
-            save_cleaned_data(cleaned_df, cleaned_filepath)
-            metrics['clean_time'].append(time.time() - start_time)  # Append clean time
-            metrics['dates'].append(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))  # Date after clean success
-
-            cleaned_df = load_data(cleaned_filepath)
-            if cleaned_df is not None:
-                transformed_df = transform_data(cleaned_df)
-                
-                if validate_transformed_data(transformed_df):
-                    save_transformed_data(transformed_df, transformed_filepath)
-                    metrics['transform_time'].append(time.time() - start_time)  # Append transform time
-                    metrics['dates'].append(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))  # Date after transform success
-                else:
-                    logger.error("Transformed data validation failed.")
-                    metrics['transform_time'].append(None)  # Append None for failed transform
-                    metrics['dates'].append(None)  # Append None for failed transform
+            save_handle = None
+            if persist_cleaned:
+                save_handle = start_background_save(save_cleaned_data, cleaned_df, cleaned_filepath)
+
+            # Transform a copy so the background save sees the cleaned frame unchanged
+            transformed_df = transform_data(cleaned_df.copy(deep=False))
+            
+            if validate_transformed_data(transformed_df):
+                save_transformed_data(transformed_df, transformed_filepath)
+                status = 'success'
             else:
-                logger.error("Failed to load cleaned data.")
-                metrics['transform_time'].append(None)  # Append None for failed load
-                metrics['dates'].append(None)  # Append None for failed load
+                logger.error("Transformed data validation failed.")
+
+            finish_background_save(save_handle)
         else:
             logger.error("Cleaned data validation failed.")
-            metrics['clean_time'].append(None)  # Append None for failed clean
-            metrics['dates'].append(None)  # Append None for failed clean
     else:
         logger.error("Failed to load initial data.")
-        metrics['load_time'].append(None)  # Append None for failed load
-        metrics['dates'].append(None)  # Append None for failed load
+    finish_run(status)
 
-    print_monitoring_results()
+    print_monitoring_results(run_id)
+    print_stage_profiles()
 
-    success_rates_path = plot_success_rates(metrics)
-    trends_path = plot_trends(metrics)
+    success_rates_path = plot_success_rates(stage_success_counts())
+    trends_path = plot_trends(stage_duration_trends())
     generate_report(report_filepath, success_rates_path, trends_path)
     logger.info("ETL process and report generation completed.")
 
@@ -275,5 +266,6 @@ if __name__ == "__main__":
     cleaned_filepath = 'cleaned_data.pkl'
     transformed_filepath = 'transform_data.pkl'
     report_filepath = 'reports/etl_report.html'
+    persist_cleaned = True  # Set to False to skip writing the intermediate cleaned data
     
-    main(input_filepath, cleaned_filepath, transformed_filepath, report_filepath)
\ No newline at end of file
+    main(input_filepath, cleaned_filepath, transformed_filepath, report_filepath, persist_cleaned)
\ No newline at end of file
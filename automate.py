@@ -3,8 +3,13 @@
 import pandas as pd
 import os
 from logger_setup import logger  # Import the configured logger
+from background_save import start_background_save, finish_background_save
+from etl_automation import add_calendar_features, atomic_output
+from profiling import profile_stage, start_profile_run
+from scheduler import pipeline_lock, output_lock_path
 
 # Function to load data
+@profile_stage('load')
 def load_data(filepath):
     """
     Load data from a specified file path, handling both CSV and Pickle formats.
@@ -35,6 +40,7 @@ def load_data(filepath):
         return None
 
 # Function for cleaning the data
+@profile_stage('clean')
 def clean_data(df):
     """
     Clean the data by handling missing values and ensuring correct data types.
@@ -69,6 +75,7 @@ def clean_data(df):
         return None
 
 # Function to validate cleaned data
+@profile_stage('validate_cleaned')
 def validate_cleaned_data(df):
     """
     Validates the cleaned data to ensure it meets necessary conditions.
@@ -93,6 +100,7 @@ def validate_cleaned_data(df):
         return False
 
 # Function to save cleaned data
+@profile_stage('save_cleaned')
 def save_cleaned_data(df, cleaned_filepath):
     """
     Save the cleaned data to a specified file path.
@@ -100,14 +108,21 @@ def save_cleaned_data(df, cleaned_filepath):
     Args:
     - df (DataFrame): The DataFrame to save.
     - cleaned_filepath (str): Path to save the cleaned data.
+
+    Returns:
+    - bool: True if the data was saved.
     """
     try:
-        df.to_pickle(cleaned_filepath)
+        with atomic_output(cleaned_filepath) as temp_path:
+            df.to_pickle(temp_path)
         logger.info("Cleaned data saved successfully.")
+        return True
     except Exception as e:
         logger.error(f"Error saving cleaned data: {e}")
+        return False
 
 # Function for transforming the data
+@profile_stage('transform')
 def transform_data(df):
     """
     Perform data transformation, including feature engineering.
@@ -122,22 +137,8 @@ def transform_data(df):
         logger.error("Error: DataFrame is None. Transformation skipped.")
         return None    
     try:
-        # Create a Day of Week column
-        df['Day of Week'] = df['Date'].dt.day_name()
-        # Example transformation: Add a 'Season' column based on 'Date'
-        df['Month'] = df['Date'].dt.month
-
-        def get_season(month):
-            if month in [12, 1, 2]:
-                return 'Winter'
-            elif month in [3, 4, 5]:
-                return 'Spring'
-            elif month in [6, 7, 8]:
-                return 'Summer'
-            else:
-                return 'Fall'
-
-        df['Season'] = df['Month'].apply(get_season)
+        # Add 'Day of Week', 'Month' and 'Season' columns based on 'Date'
+        add_calendar_features(df)
 
         # Add a derived column, Revenue
         df['Revenue'] = df['Quantity'] * df['Price per Unit']
@@ -149,6 +150,7 @@ def transform_data(df):
         return None
 
 # Function to validate transformed data
+@profile_stage('validate_transformed')
 def validate_transformed_data(df):
     """
     Validates the transformed data to ensure transformations were successful.
@@ -174,6 +176,7 @@ def validate_transformed_data(df):
         return False
 
 # Function to save transformed data
+@profile_stage('save_transformed')
 def save_transformed_data(df, transformed_filepath):
     """
     Save the transformed data to a specified file path.
@@ -181,15 +184,24 @@ def save_transformed_data(df, transformed_filepath):
     Args:
     - df (DataFrame): The DataFrame to save.
     - transformed_filepath (str): Path to save the transformed data.
+
+    Returns:
+    - bool: True if the data was saved.
     """
     try:
-        df.to_pickle(transformed_filepath)
+        with atomic_output(transformed_filepath) as temp_path:
+            df.to_pickle(temp_path)
         logger.info("Transformed data saved successfully.")
+        return True
     except Exception as e:
         logger.error(f"Error saving transformed data: {e}")
+        return False
 
 # Main function to run the data pipeline
-def main(input_filepath, cleaned_filepath, transformed_filepath):
+def main(input_filepath, cleaned_filepath, transformed_filepath, persist_cleaned=True):
+    succeeded = False
+    # Scheduler workers run the pipeline many times; give each run its own ID
+    start_profile_run()
     # Load the initial data
     df = load_data(input_filepath)
     if df is not None:
@@ -198,25 +210,34 @@ def main(input_filepath, cleaned_filepath, transformed_filepath):
         
         # Validate cleaned data
         if cleaned_df is not None and validate_cleaned_data(cleaned_df):
-            # Save cleaned data
-            save_cleaned_data(cleaned_df, cleaned_filepath)
-            
-            # Load cleaned data for transformation
-            cleaned_df = load_data(cleaned_filepath)
-            if cleaned_df is not None:
-                # Transform the data
-                transformed_df = transform_data(cleaned_df)
+            # Save cleaned data in the background while transforming
+            save_handle = None
+            if persist_cleaned:
+                save_handle = start_background_save(save_cleaned_data, cleaned_df, cleaned_filepath)
+
+            # Transform a copy so the background save sees the cleaned frame unchanged
+            transformed_df = transform_data(cleaned_df.copy(deep=False))
             
-                # Validate transformed data
-                if transformed_df is not None and validate_transformed_data(transformed_df):
-                    # Save the transformed data
-                    save_transformed_data(transformed_df, transformed_filepath)
+            # Validate transformed data
+            if transformed_df is not None and validate_transformed_data(transformed_df):
+                # Save the transformed data
+                succeeded = save_transformed_data(transformed_df, transformed_filepath)
+
+            finish_background_save(save_handle)
+    return succeeded
 
 if __name__ == "__main__":
     # Define file paths
     input_filepath = 'data/retail_sales_dataset.csv'
     cleaned_filepath = 'cleaned_data.pkl'
     transformed_filepath = 'transform_data.pkl'
+    # Set to False to skip writing the intermediate cleaned data
+    persist_cleaned = True
     
-    # Run the data pipeline
-    main(input_filepath, cleaned_filepath, transformed_filepath)
+    # Run the data pipeline, unless another run (e.g. the scheduler) is
+    # already writing the same outputs
+    with pipeline_lock(output_lock_path(cleaned_filepath)) as acquired:
+        if acquired:
+            main(input_filepath, cleaned_filepath, transformed_filepath, persist_cleaned)
+        else:
+            logger.warning(f"Another run is writing {cleaned_filepath}, skipping this run.")
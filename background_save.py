@@ -0,0 +1,58 @@
+import threading
+import time
+from logger_setup import logger  # Importing the configured logger
+
+# Function to start saving data on a background thread
+def start_background_save(save_func, df, filepath):
+    """
+    Run save_func(df, filepath) on a background writer thread so the caller
+    can carry on working with df while it is persisted.
+
+    The caller must not modify df in place until the save has finished;
+    hand later stages a copy instead.
+
+    Args:
+    - save_func (callable): Save function taking (df, filepath).
+    - df (DataFrame): The DataFrame to save.
+    - filepath (str): Path to save the data to.
+
+    Returns:
+    - dict: Handle to pass to finish_background_save. Once the save has
+      finished, handle['result'] holds save_func's return value.
+    """
+    handle = {'filepath': filepath, 'duration': 0.0, 'result': None}
+
+    def write():
+        start_time = time.perf_counter()
+        try:
+            handle['result'] = save_func(df, filepath)
+        finally:
+            handle['duration'] = time.perf_counter() - start_time
+
+    handle['thread'] = threading.Thread(target=write, name='background-save')
+    handle['thread'].start()
+    return handle
+
+# Function to wait for a background save
+def finish_background_save(handle):
+    """
+    Wait for a background save to finish and report the time it saved.
+
+    Args:
+    - handle (dict or None): Handle returned by start_background_save, or
+      None if nothing was saved.
+
+    Returns:
+    - float: Seconds of the save that overlapped with other work.
+    """
+    if handle is None:
+        return 0.0
+
+    wait_start = time.perf_counter()
+    handle['thread'].join()
+    waited = time.perf_counter() - wait_start
+
+    overlap = max(handle['duration'] - waited, 0.0)
+    logger.info(f"Background save of {handle['filepath']} took {handle['duration']:.3f}s, "
+                f"{overlap:.3f}s overlapped with other work.")
+    return overlap
@@ -0,0 +1,150 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# Benchmark for CSV ingestion: parse time and peak RSS of load_data + clean_data
+# with the declared schema, against the previous inferred-dtype path.
+#
+# Usage: python benchmark_ingestion.py [rows] [csv_path]
+
+DEFAULT_ROWS = 10_000_000
+DEFAULT_CSV_PATH = 'data/synthetic_retail_sales.csv'
+
+# Columns that generate_synthetic_csv may leave empty (the Transaction ID is never missing)
+NULLABLE_COLUMNS = ['Date', 'Customer ID', 'Gender', 'Age', 'Product Category', 'Quantity',
+                    'Price per Unit', 'Total Amount']
+
+# Function to generate a synthetic retail CSV
+def generate_synthetic_csv(filepath, rows, seed=0, chunk_rows=1_000_000, customers=None, null_rate=0.0,
+                           bad_value_rate=0.0):
+    """
+    Write a synthetic CSV with the same columns and value ranges as
+    retail_sales_dataset.csv.
+
+    Args:
+    - filepath (str): Path of the CSV to write.
+    - rows (int): Number of transactions to generate.
+    - seed (int): Random seed, so runs are reproducible.
+    - chunk_rows (int): Rows generated and written per batch.
+    - customers (int, optional): Number of distinct customers to draw
+      from. Defaults to rows.
+    - null_rate (float): Fraction of cells in the nullable columns left empty.
+    - bad_value_rate (float): Fraction of rows given a non-positive Quantity
+      or Price per Unit, which clean_data filters out.
+    """
+    rng = np.random.default_rng(seed)
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    customers = customers or rows
+    prices = np.array([25, 30, 50, 300, 500])
+    for start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - start)
+        quantity = rng.integers(1, 5, n)
+        price = rng.choice(prices, n)
+        days = rng.integers(0, 365, n)
+        # Format each distinct customer once rather than every row
+        customer_numbers, customer_codes = np.unique(rng.integers(1, customers + 1, n), return_inverse=True)
+        customer_ids = np.array([f"CUST{number:03d}" for number in customer_numbers])[customer_codes]
+        chunk = pd.DataFrame({
+            'Transaction ID': np.arange(start + 1, start + n + 1),
+            'Date': pd.Timestamp('2023-01-01') + pd.to_timedelta(days, unit='D'),
+            'Customer ID': customer_ids,
+            'Gender': rng.choice(['Male', 'Female'], n),
+            'Age': rng.integers(18, 65, n),
+            'Product Category': rng.choice(['Beauty', 'Clothing', 'Electronics'], n),
+            'Quantity': quantity,
+            'Price per Unit': price,
+            'Total Amount': quantity * price,
+        })
+        if bad_value_rate:
+            bad = rng.random(n) < bad_value_rate
+            column = np.where(rng.random(n) < 0.5, 'Quantity', 'Price per Unit')
+            chunk.loc[bad & (column == 'Quantity'), 'Quantity'] = 0
+            chunk.loc[bad & (column == 'Price per Unit'), 'Price per Unit'] = -1
+        if null_rate:
+            for name in NULLABLE_COLUMNS:
+                column = chunk[name]
+                if pd.api.types.is_integer_dtype(column):
+                    # Keep integers written without a decimal point
+                    column = column.astype('Int64')
+                chunk[name] = column.mask(rng.random(n) < null_rate)
+        chunk.to_csv(filepath, mode='w' if start == 0 else 'a', header=start == 0,
+                     index=False, date_format='%Y-%m-%d')
+
+# The ingestion path before the declared schema
+def _ingest_inferred(filepath):
+    df = pd.read_csv(filepath)
+    df.dropna(inplace=True)
+    df['Transaction ID'] = df['Transaction ID'].astype(int)
+    df['Date'] = pd.to_datetime(df['Date'])
+    df['Customer ID'] = df['Customer ID'].astype(str)
+    df['Gender'] = df['Gender'].astype('category')
+    df['Product Category'] = df['Product Category'].astype('category')
+    df['Quantity'] = df['Quantity'].astype(int)
+    df['Price per Unit'] = df['Price per Unit'].astype(float)
+    df['Total Amount'] = df['Total Amount'].astype(float)
+    return df[(df['Quantity'] > 0) & (df['Price per Unit'] > 0)]
+
+# The ingestion path with the declared schema
+def _ingest_schema(filepath):
+    from etl_automation import load_data, clean_data
+    return clean_data(load_data(filepath))
+
+INGESTION_MODES = {
+    'inferred': _ingest_inferred,
+    'schema': _ingest_schema,
+}
+
+# Function to time one ingestion mode in this process
+def run_mode(mode, filepath):
+    """
+    Run one ingestion mode and measure it.
+
+    Args:
+    - mode (str): Key of INGESTION_MODES.
+    - filepath (str): CSV to ingest.
+
+    Returns:
+    - dict: Seconds taken, peak RSS in MB, rows and in-memory size in MB.
+    """
+    start_time = time.perf_counter()
+    df = INGESTION_MODES[mode](filepath)
+    seconds = time.perf_counter() - start_time
+    return {
+        'mode': mode,
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'rows': len(df),
+        'frame_mb': round(df.memory_usage(deep=True).sum() / 2**20, 1),
+    }
+
+# Function to run every mode in a fresh process so peak RSS is not shared
+def run_benchmark(filepath):
+    results = []
+    for mode in INGESTION_MODES:
+        output = subprocess.run([sys.executable, __file__, '--mode', mode, filepath],
+                                check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == '--mode':
+        print(json.dumps(run_mode(sys.argv[2], sys.argv[3])))
+        sys.exit(0)
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CSV_PATH
+    if not os.path.exists(csv_path):
+        print(f"Generating {rows} rows into {csv_path}...")
+        generate_synthetic_csv(csv_path, rows)
+
+    for result in run_benchmark(csv_path):
+        print(f"{result['mode']:>9}: {result['seconds']:8.2f}s  peak RSS {result['peak_rss_mb']:8.1f} MB  "
+              f"frame {result['frame_mb']:8.1f} MB  ({result['rows']} rows)")
@@ -0,0 +1,333 @@
+import argparse
+import ctypes
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import pandas as pd
+from benchmark_ingestion import generate_synthetic_csv
+
+# Benchmark suite: runs every pipeline stage and the KPI aggregations on
+# synthetic data of increasing size, writes the results as JSON and flags
+# regressions against a stored baseline.
+#
+# Usage: python benchmark_suite.py [--sizes 10k,1m,10m,50m] [--save-baseline]
+
+BENCHMARK_SIZES = {
+    '10k': 10_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+    '50m': 50_000_000,
+}
+DEFAULT_SIZES = '10k,1m'
+
+# Synthetic data settings: on average each customer makes this many
+# transactions, and a small share of cells are missing or invalid
+TRANSACTIONS_PER_CUSTOMER = 10
+DEFAULT_NULL_RATE = 0.01
+DEFAULT_BAD_VALUE_RATE = 0.01
+
+RESULTS_PATH = 'benchmark_results.json'
+BASELINE_PATH = 'benchmark_baseline.json'
+
+# A stage regresses when its throughput drops, or its peak RSS grows, by
+# more than the tolerance; stages faster than MIN_SECONDS are too noisy to
+# compare on throughput
+DEFAULT_TOLERANCE = 0.25
+MIN_SECONDS = 0.05
+
+# clean_data must not need more memory than this multiple of its input.
+# Below MEMORY_CHECK_MIN_ROWS the ratio is dominated by page granularity
+# and allocator noise, so smaller sizes are not checked.
+CLEAN_PEAK_LIMIT = 1.3
+MEMORY_CHECK_MIN_ROWS = 1_000_000
+
+# Function to return the path of a synthetic dataset, generating it if needed
+def synthetic_dataset(size, seed=0, null_rate=DEFAULT_NULL_RATE, bad_value_rate=DEFAULT_BAD_VALUE_RATE):
+    """
+    Return the CSV for one benchmark size, generating it on first use.
+
+    Args:
+    - size (str): Key of BENCHMARK_SIZES.
+    - seed (int): Random seed.
+    - null_rate (float): Fraction of missing cells.
+    - bad_value_rate (float): Fraction of rows with invalid values.
+
+    Returns:
+    - str: Path of the CSV.
+    """
+    rows = BENCHMARK_SIZES[size]
+    filepath = f"data/synthetic_{size}_seed{seed}_null{null_rate}_bad{bad_value_rate}.csv"
+    if not os.path.exists(filepath):
+        print(f"Generating {rows} rows into {filepath}...")
+        generate_synthetic_csv(filepath + '.tmp', rows, seed=seed,
+                               customers=max(rows // TRANSACTIONS_PER_CUSTOMER, 1),
+                               null_rate=null_rate, bad_value_rate=bad_value_rate)
+        os.replace(filepath + '.tmp', filepath)
+    return filepath
+
+# Helper computing the notebook's KPIs from row-level data
+def _row_level_kpis(df):
+    monthly = df.set_index('Date')['Total Amount'].resample('ME').sum()
+    by_dimension = [df.groupby(column, observed=True)['Total Amount'].sum()
+                    for column in ('Season', 'Gender', 'Product Category')]
+    customers = df.groupby('Customer ID', observed=True)['Total Amount']
+    return monthly, by_dimension, customers.mean(), customers.sum().nlargest(10), df['Customer ID'].value_counts()
+
+# Helper computing the same KPIs from the cube
+def _cube_kpis(cube):
+    from kpi_cube import (monthly_sales, sales_by, top_customers, average_spend_per_customer,
+                          transaction_frequency)
+    return (monthly_sales(cube), [sales_by(cube, column) for column in ('Season', 'Gender', 'Product Category')],
+            average_spend_per_customer(cube), top_customers(cube), transaction_frequency(cube))
+
+# Function to benchmark every stage on one dataset in this process
+def run_stages(csv_path, rows):
+    """
+    Run the pipeline stages and KPI aggregations on one dataset, timing
+    each.
+
+    Peak RSS is the process high-water mark after each stage, so it
+    includes every earlier stage; run each dataset in a fresh process.
+
+    Args:
+    - csv_path (str): Synthetic CSV to process.
+    - rows (int): Rows in the CSV.
+
+    Returns:
+    - list: One result dict per stage.
+    """
+    from etl_automation import (load_data, clean_data, validate_cleaned_data, transform_data,
+                                validate_transformed_data, save_cleaned_data, save_transformed_data)
+    from kpi_cube import build_cube
+    from metrics_store import peak_memory_mb
+    from profiling import configure_profiling
+
+    # Measure the stages themselves, not the profiler
+    configure_profiling(trace_memory=False, capture=None)
+    results = []
+
+    def timed(stage, rows_in, func, *args):
+        start_time = time.perf_counter()
+        output = func(*args)
+        seconds = time.perf_counter() - start_time
+        results.append({'stage': stage, 'rows': rows_in, 'seconds': round(seconds, 4),
+                        'rows_per_sec': round(rows_in / seconds) if seconds else None,
+                        'peak_rss_mb': round(peak_memory_mb(), 1)})
+        return output
+
+    with tempfile.TemporaryDirectory() as workdir:
+        df = timed('load', rows, load_data, csv_path)
+        cleaned_df = timed('clean', len(df), clean_data, df)
+        del df
+        timed('validate_cleaned', len(cleaned_df), validate_cleaned_data, cleaned_df)
+        transformed_df = timed('transform', len(cleaned_df), transform_data, cleaned_df.copy(deep=False))
+        timed('validate_transformed', len(transformed_df), validate_transformed_data, transformed_df)
+        timed('save_cleaned', len(cleaned_df), save_cleaned_data, cleaned_df,
+              os.path.join(workdir, 'cleaned_data.parquet'))
+        timed('save_transformed', len(transformed_df), save_transformed_data, transformed_df,
+              os.path.join(workdir, 'transform_data.parquet'))
+        timed('kpi_row_level', len(transformed_df), _row_level_kpis, transformed_df)
+        cube = timed('build_cube', len(transformed_df), build_cube, transformed_df)
+        timed('kpi_cube', len(transformed_df), _cube_kpis, cube)
+    return results
+
+# Helper reading this process's current RSS in MB (Linux)
+def _current_rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+# Helper handing memory freed by Python and Arrow back to the OS (glibc),
+# so RSS reflects live data rather than allocator slack
+def _release_free_memory():
+    gc.collect()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+# Function to measure the peak memory of clean_data relative to its input
+def measure_clean_memory(csv_path):
+    """
+    Measure how much memory clean_data needs at its peak, as a multiple of
+    the in-memory size of its input.
+
+    RSS is sampled every millisecond while clean_data runs. Arrow buffers
+    are allocated from the system allocator here, and free memory is
+    trimmed before the baseline is taken, so RSS reflects live data.
+
+    Args:
+    - csv_path (str): Synthetic CSV to load and clean.
+
+    Returns:
+    - dict: Input size, peak memory held by data while cleaning, their
+      ratio and whether it is within CLEAN_PEAK_LIMIT.
+    """
+    import pyarrow as pa
+    from etl_automation import load_data, clean_data
+    pa.set_memory_pool(pa.system_memory_pool())
+
+    df = load_data(csv_path)
+    input_mb = df.memory_usage(deep=True).sum() / 2**20
+    _release_free_memory()
+    # RSS not taken up by the input: interpreter, libraries, allocator slack
+    overhead_mb = _current_rss_mb() - input_mb
+
+    peak = {'rss_mb': 0.0}
+    stop = threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            peak['rss_mb'] = max(peak['rss_mb'], _current_rss_mb())
+            time.sleep(0.001)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    cleaned_df = clean_data(df)
+    stop.set()
+    sampler.join()
+
+    peak_mb = max(peak['rss_mb'], _current_rss_mb()) - overhead_mb
+    ratio = float(peak_mb / input_mb)
+    return {'rows': len(cleaned_df), 'input_mb': round(input_mb, 1), 'peak_mb': round(peak_mb, 1),
+            'peak_ratio': round(ratio, 3), 'within_limit': bool(ratio <= CLEAN_PEAK_LIMIT)}
+
+# Function to benchmark every requested size, each in a fresh process
+def run_suite(sizes, seed=0, null_rate=DEFAULT_NULL_RATE, bad_value_rate=DEFAULT_BAD_VALUE_RATE):
+    """
+    Benchmark each size in its own process, so peak RSS is not shared.
+
+    Args:
+    - sizes (list): Keys of BENCHMARK_SIZES.
+    - seed (int): Random seed of the synthetic data.
+    - null_rate (float): Fraction of missing cells.
+    - bad_value_rate (float): Fraction of rows with invalid values.
+
+    Returns:
+    - dict: Run metadata, one result per size and stage, and the
+      clean_data peak memory check of each size.
+    """
+    results = []
+    memory_checks = []
+    for size in sizes:
+        csv_path = synthetic_dataset(size, seed, null_rate, bad_value_rate)
+        print(f"Benchmarking {size} ({BENCHMARK_SIZES[size]} rows)...")
+        output = subprocess.run([sys.executable, __file__, '--run-stages', csv_path, str(BENCHMARK_SIZES[size])],
+                                check=True, capture_output=True, text=True).stdout
+        for result in json.loads(output.strip().splitlines()[-1]):
+            results.append({'size': size, **result})
+
+        # Peak memory of clean_data, measured in its own process
+        if BENCHMARK_SIZES[size] < MEMORY_CHECK_MIN_ROWS:
+            continue
+        output = subprocess.run([sys.executable, __file__, '--clean-memory', csv_path],
+                                check=True, capture_output=True, text=True).stdout
+        memory_checks.append({'size': size, **json.loads(output.strip().splitlines()[-1])})
+
+    return {
+        'created_at': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'null_rate': null_rate,
+        'bad_value_rate': bad_value_rate,
+        'results': results,
+        'memory_checks': memory_checks,
+    }
+
+# Function to compare results with a baseline
+def compare_to_baseline(run, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare each size and stage with the baseline run.
+
+    Args:
+    - run (dict): Output of run_suite.
+    - baseline (dict): An earlier output of run_suite.
+    - tolerance (float): Allowed relative slowdown or RSS growth.
+
+    Returns:
+    - list: One dict per stage present in both runs, with the throughput
+      and peak RSS ratios and whether it regressed.
+    """
+    previous = {(result['size'], result['stage']): result for result in baseline['results']}
+    comparisons = []
+    for result in run['results']:
+        before = previous.get((result['size'], result['stage']))
+        if before is None:
+            continue
+        throughput_ratio = None
+        if result['rows_per_sec'] and before['rows_per_sec']:
+            throughput_ratio = result['rows_per_sec'] / before['rows_per_sec']
+        rss_ratio = result['peak_rss_mb'] / before['peak_rss_mb']
+        slower = (throughput_ratio is not None and throughput_ratio < 1 - tolerance
+                  and max(result['seconds'], before['seconds']) >= MIN_SECONDS)
+        comparisons.append({'size': result['size'], 'stage': result['stage'],
+                            'throughput_ratio': None if throughput_ratio is None else round(throughput_ratio, 3),
+                            'rss_ratio': round(rss_ratio, 3),
+                            'regressed': slower or rss_ratio > 1 + tolerance})
+    return comparisons
+
+# Function to print benchmark results
+def print_results(run, comparisons):
+    for check in run['memory_checks']:
+        status = "ok" if check['within_limit'] else f"ABOVE {CLEAN_PEAK_LIMIT}x"
+        print(f"{check['size']:>4} clean_data peak {check['peak_mb']:.1f} MB for {check['input_mb']:.1f} MB of input "
+              f"({check['peak_ratio']}x, {status})")
+    ratios = {(comparison['size'], comparison['stage']): comparison for comparison in comparisons}
+    for result in run['results']:
+        line = (f"{result['size']:>4} {result['stage']:<21} {result['seconds']:9.3f}s "
+                f"{result['rows_per_sec'] or 0:>13,} rows/s  peak RSS {result['peak_rss_mb']:8.1f} MB")
+        comparison = ratios.get((result['size'], result['stage']))
+        if comparison:
+            line += f"  throughput x{comparison['throughput_ratio']}  RSS x{comparison['rss_ratio']}"
+            if comparison['regressed']:
+                line += "  REGRESSION"
+        print(line)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == '--run-stages':
+        print(json.dumps(run_stages(sys.argv[2], int(sys.argv[3]))))
+        sys.exit(0)
+    if len(sys.argv) == 3 and sys.argv[1] == '--clean-memory':
+        print(json.dumps(measure_clean_memory(sys.argv[2])))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark the ETL pipeline on synthetic data.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"Comma-separated sizes from {', '.join(BENCHMARK_SIZES)}")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--null-rate', type=float, default=DEFAULT_NULL_RATE)
+    parser.add_argument('--bad-value-rate', type=float, default=DEFAULT_BAD_VALUE_RATE)
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baseline")
+    args = parser.parse_args()
+
+    run = run_suite(args.sizes.split(','), args.seed, args.null_rate, args.bad_value_rate)
+
+    comparisons = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            comparisons = compare_to_baseline(run, json.load(f), args.tolerance)
+    run['comparisons'] = comparisons
+    print_results(run, comparisons)
+
+    with open(args.output, 'w') as f:
+        json.dump(run, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f"Saved baseline to {args.baseline}.")
+
+    # A non-zero exit lets CI fail on regressions
+    failed = any(comparison['regressed'] for comparison in comparisons) or \
+        not all(check['within_limit'] for check in run['memory_checks'])
+    sys.exit(1 if failed else 0)
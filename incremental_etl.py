@@ -0,0 +1,283 @@
+import glob
+import hashlib
+import io
+import json
+import os
+import pandas as pd
+from etl_automation import (read_retail_csv, load_data, write_data, append_data_part, clean_data,
+                            validate_cleaned_data, transform_data, validate_transformed_data, PARQUET_COMPRESSION,
+                            PARTITION_COLUMN)
+from kpi_cube import build_cube, load_cube, update_cube, save_cube, sales_month, CUBE_WATERMARK_FILE
+from warehouse import load_to_warehouse
+
+# Bytes before the watermark offset that are hashed to detect a rewritten input file
+TAIL_HASH_BYTES = 4096
+
+# Function to load the watermark of the last successful run
+def load_watermark(watermark_filepath):
+    """
+    Load the high-water mark recorded by the last successful incremental run.
+
+    Args:
+    - watermark_filepath (str): Path to the watermark JSON file.
+
+    Returns:
+    - dict: The watermark, or None if no run has completed yet.
+    """
+    if not os.path.exists(watermark_filepath):
+        return None
+    try:
+        with open(watermark_filepath) as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading watermark, reprocessing from scratch: {e}")
+        return None
+
+# Function to record the watermark of a successful run
+def save_watermark(watermark, watermark_filepath):
+    """
+    Save the watermark, replacing the previous one in a single rename.
+
+    Args:
+    - watermark (dict): The watermark to save.
+    - watermark_filepath (str): Path to the watermark JSON file.
+    """
+    temp_filepath = watermark_filepath + '.tmp'
+    with open(temp_filepath, 'w') as f:
+        json.dump(watermark, f, indent=2)
+    os.replace(temp_filepath, watermark_filepath)
+
+# Function to keep the rows that come after a watermark
+def rows_past_watermark(df, watermark):
+    """
+    Keep the rows whose Transaction ID or Date is past the watermark.
+
+    Args:
+    - df (DataFrame): Rows with 'Transaction ID' and 'Date' columns.
+    - watermark (dict): Watermark with 'transaction_id' and 'date'.
+
+    Returns:
+    - DataFrame: The rows past the watermark.
+    """
+    newer = df['Transaction ID'] > watermark['transaction_id']
+    if watermark['date'] is not None:
+        newer |= df['Date'] > pd.Timestamp(watermark['date'])
+    return df[newer]
+
+# Helper hashing the bytes just before an offset in the input file
+def _tail_hash(f, offset):
+    start = max(offset - TAIL_HASH_BYTES, 0)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+# Function to read the rows appended since the last run
+def read_new_rows(input_filepath, watermark):
+    """
+    Read the rows of the input CSV that come after the watermark.
+
+    When the input has only been appended to since the last run (checked by
+    hashing the bytes just before the recorded offset), only the bytes after
+    that offset are parsed, so the cost depends on the number of new rows.
+    Otherwise the whole file is parsed. In both cases rows are kept only if
+    their Transaction ID or Date is past the watermark.
+
+    Args:
+    - input_filepath (str): Path to the raw CSV file.
+    - watermark (dict or None): Watermark from the last run.
+
+    Returns:
+    - tuple: (DataFrame of new rows or None, offset of the last complete
+      line read, hash of the bytes before that offset).
+    """
+    with open(input_filepath, 'rb') as f:
+        header = f.readline()
+        start = len(header)
+        if watermark is not None:
+            offset = watermark.get('input_offset', 0)
+            if start <= offset <= os.path.getsize(input_filepath) and \
+                    _tail_hash(f, offset) == watermark.get('input_tail_hash'):
+                start = offset
+            else:
+                print("Input file was rewritten since the last run, scanning it in full.")
+        f.seek(start)
+        body = f.read()
+
+        # Leave a partly written last line for the next run
+        body = body[:body.rfind(b'\n') + 1]
+        end = start + len(body)
+        tail_hash = _tail_hash(f, end)
+
+    if not body:
+        return None, end, tail_hash
+
+    df = read_retail_csv(io.BytesIO(header + body))
+    if watermark is not None:
+        df = rows_past_watermark(df, watermark)
+    return df, end, tail_hash
+
+# Function to merge new rows into an existing data store
+def merge_into_store(df, filepath):
+    """
+    Add new rows to a data store, skipping any whose Transaction ID is
+    already stored.
+
+    Stores are appended to in their own layout, so existing data is never
+    rewritten: month-partitioned Parquet datasets get new files in the
+    affected partitions, and directories of parts written by the streaming
+    or parallel pipelines get one more part. Only the 'Transaction ID'
+    column of the Parquet data covering the new rows' dates is read to
+    de-duplicate. Other formats are loaded, concatenated and written back.
+
+    Args:
+    - df (DataFrame): The new rows.
+    - filepath (str): Path of the store.
+
+    Returns:
+    - DataFrame: The rows that were added.
+    """
+    df = df.drop_duplicates(subset='Transaction ID', keep='last')
+    if df.empty:
+        return df
+    if os.path.exists(filepath):
+        # A transaction read again has the same date, so only the stored IDs
+        # in the new rows' date range (and month partitions) are compared
+        date_range = None
+        if filepath.endswith('.parquet'):
+            date_range = (df['Date'].min(), df['Date'].max())
+        existing_ids = load_data(filepath, columns=['Transaction ID'], date_range=date_range)
+        if existing_ids is not None:
+            df = df[~df['Transaction ID'].isin(existing_ids['Transaction ID'])]
+    if df.empty:
+        return df
+
+    if glob.glob(os.path.join(filepath, 'part-*')):
+        append_data_part(df, filepath)
+    elif os.path.isdir(filepath) and filepath.endswith('.parquet'):
+        partitioned = df.assign(**{PARTITION_COLUMN: sales_month(df['Date'])})
+        partitioned.to_parquet(filepath, compression=PARQUET_COMPRESSION,
+                               partition_cols=[PARTITION_COLUMN], index=False)
+    elif os.path.exists(filepath):
+        existing = load_data(filepath)
+        write_data(pd.concat([existing, df], ignore_index=True), filepath)
+    else:
+        write_data(df, filepath)
+    return df
+
+# Function to add the rows the saved KPI cube has not seen yet
+def refresh_cube(cube_dirpath, df, transformed_filepath, watermark):
+    """
+    Fold the rows past the cube's own watermark into the saved KPI cube.
+
+    save_cube writes the cube watermark last, so rows merged into the
+    stores by a run that failed before updating the cube are added on the
+    retry, and rows already in the cube are not added twice. Without a cube
+    watermark (a new cube, one rebuilt by the full pipeline, or a save that
+    was interrupted), the cube is rebuilt from the whole transformed store.
+
+    Args:
+    - cube_dirpath (str): Directory of the KPI cube.
+    - df (DataFrame): Transformed rows read by this run.
+    - transformed_filepath (str): Path of the transformed data store.
+    - watermark (dict): Watermark of this run, recorded as the cube's.
+
+    Returns:
+    - bool: True if the cube is up to date.
+    """
+    cube_watermark = load_watermark(os.path.join(cube_dirpath, CUBE_WATERMARK_FILE))
+    try:
+        if cube_watermark is None:
+            cube = build_cube(load_data(transformed_filepath))
+        else:
+            df = rows_past_watermark(df.drop_duplicates(subset='Transaction ID', keep='last'), cube_watermark)
+            if df.empty:
+                return True
+            cube = update_cube(load_cube(cube_dirpath), df)
+    except Exception as e:
+        print(f"Error updating KPI cube: {e}")
+        return False
+    return save_cube(cube, cube_dirpath,
+                     watermark={'transaction_id': watermark['transaction_id'], 'date': watermark['date']})
+
+# Incremental version of the data pipeline
+def run_incremental_pipeline(input_filepath, cleaned_filepath, transformed_filepath, watermark_filepath,
+                             cube_dirpath=None, warehouse_db_path=None):
+    """
+    Clean, transform and merge only the transactions added since the last
+    successful run.
+
+    The watermark (highest Transaction ID and Date, plus how far into the
+    input file the last run read) is only advanced once the new rows have
+    passed validation and been merged into both stores, so a failed run
+    is retried in full on the next run.
+
+    Args:
+    - input_filepath (str): Path to the raw CSV file.
+    - cleaned_filepath (str): Path of the cleaned data store.
+    - transformed_filepath (str): Path of the transformed data store.
+    - watermark_filepath (str): Path of the watermark JSON file.
+    - cube_dirpath (str, optional): Directory of the KPI cube to update
+      with the new transactions; see refresh_cube.
+    - warehouse_db_path (str, optional): SQLite warehouse to upsert the new
+      transactions into. The watermark is not advanced if this fails.
+
+    Returns:
+    - int: Number of new transactions merged, or None if the run failed.
+    """
+    watermark = load_watermark(watermark_filepath)
+    try:
+        df, input_offset, input_tail_hash = read_new_rows(input_filepath, watermark)
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return None
+
+    new_watermark = dict(watermark or {'transaction_id': 0, 'date': None})
+    new_watermark.update({'input_offset': input_offset, 'input_tail_hash': input_tail_hash})
+
+    if df is None or df.empty:
+        print("No new transactions since the last run.")
+        save_watermark(new_watermark, watermark_filepath)
+        return 0
+    print(f"Read {len(df)} new rows.")
+
+    # A transaction sent again replaces the earlier copy instead of failing
+    # the unique Transaction ID rule on every retry
+    df = df.drop_duplicates(subset='Transaction ID', keep='last')
+    cleaned_df = clean_data(df)
+    if not validate_cleaned_data(cleaned_df):
+        return None
+    transformed_df = transform_data(cleaned_df.copy(deep=False))
+    if not validate_transformed_data(transformed_df):
+        return None
+
+    merge_into_store(cleaned_df, cleaned_filepath)
+    added_df = merge_into_store(transformed_df, transformed_filepath)
+
+    max_date = cleaned_df['Date'].max()
+    if new_watermark['date'] is not None:
+        max_date = max(max_date, pd.Timestamp(new_watermark['date']))
+    new_watermark['transaction_id'] = max(int(cleaned_df['Transaction ID'].max()), new_watermark['transaction_id'])
+    new_watermark['date'] = max_date.isoformat()
+
+    if cube_dirpath and not refresh_cube(cube_dirpath, transformed_df, transformed_filepath, new_watermark):
+        return None
+    # Every new row is upserted, not just the ones added to the store: rows
+    # merged by a run whose warehouse load failed are loaded on the retry
+    if warehouse_db_path and load_to_warehouse(transformed_df, warehouse_db_path) is None:
+        return None
+    save_watermark(new_watermark, watermark_filepath)
+
+    print(f"Merged {len(added_df)} new transactions.")
+    return len(added_df)
+
+if __name__ == "__main__":
+    # Define file paths
+    input_filepath = 'data/retail_sales_dataset.csv'
+    cleaned_filepath = 'cleaned_data.parquet'
+    transformed_filepath = 'transform_data.parquet'
+    watermark_filepath = 'etl_watermark.json'
+    cube_dirpath = 'kpi_cube'
+    warehouse_db_path = 'retail_data.db'
+
+    # Run the incremental data pipeline
+    run_incremental_pipeline(input_filepath, cleaned_filepath, transformed_filepath, watermark_filepath, cube_dirpath,
+                             warehouse_db_path)
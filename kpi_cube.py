@@ -0,0 +1,218 @@
+import json
+import os
+import pandas as pd
+
+# Dimensions of the aggregate cube; every KPI in the analysis notebook is a
+# roll-up over some of these
+CUBE_DIMENSIONS = ['Sales Month', 'Product Category', 'Gender', 'Season']
+CUBE_FILES = {'cube': 'cube', 'customers': 'customers'}
+# Records which transactions an incrementally updated cube holds
+CUBE_WATERMARK_FILE = 'watermark.json'
+
+# Function to derive the 'YYYY-MM' month of each date
+def sales_month(dates):
+    """
+    Label each date with its 'YYYY-MM' month.
+
+    Only the distinct months are formatted as strings, instead of every
+    row as with dt.strftime, which holds the GIL for the whole column.
+
+    Args:
+    - dates (Series): Datetime Series.
+
+    Returns:
+    - Series: Categorical month of each date, with the same index as dates.
+    """
+    months = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy()
+    codes, uniques = pd.factorize(months, sort=True)
+    labels = [f"{month // 12:04d}-{month % 12 + 1:02d}" for month in uniques]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=labels), index=dates.index)
+
+# Function to build the aggregate cube from transformed data
+def build_cube(df):
+    """
+    Aggregate transformed data into a month x category x gender x season
+    cube and a per-customer roll-up.
+
+    All measures are sums or counts, so cubes built from separate batches of
+    rows can be combined with update_cube.
+
+    Args:
+    - df (DataFrame): Transformed data.
+
+    Returns:
+    - dict: 'cube' and 'customers' DataFrames.
+    """
+    keyed = df.assign(**{'Sales Month': sales_month(df['Date'])})
+    cube = keyed.groupby(CUBE_DIMENSIONS, observed=True).agg(
+        **{'Total Amount': ('Total Amount', 'sum'),
+           'Quantity': ('Quantity', 'sum'),
+           'Transactions': ('Transaction ID', 'count')}).reset_index()
+    cube['Sales Month'] = cube['Sales Month'].astype(str)
+    customers = df.groupby('Customer ID', observed=True).agg(
+        **{'Total Amount': ('Total Amount', 'sum'),
+           'Transactions': ('Transaction ID', 'count')}).reset_index()
+    return {'cube': cube, 'customers': customers}
+
+# Function to fold new rows into an existing cube
+def update_cube(cube, df):
+    """
+    Add the aggregates of new transformed rows to an existing cube.
+
+    Args:
+    - cube (dict or None): Cube from build_cube or load_cube.
+    - df (DataFrame): New transformed rows (not already in the cube).
+
+    Returns:
+    - dict: The updated cube.
+    """
+    return combine_cubes(cube, build_cube(df))
+
+# Function to add cubes to another
+def combine_cubes(cube, *deltas):
+    """
+    Add the aggregates of one or more deltas to cube. All the tables are
+    stacked and grouped once, so combining many deltas in one call costs
+    about as much as combining one delta of their total size.
+
+    Args:
+    - cube (dict or None): Cube to add to.
+    - *deltas (dict): Cubes built from other rows, with the same tables.
+      Only those tables are combined and returned.
+
+    Returns:
+    - dict: The combined cube.
+    """
+    if cube is None:
+        cube, deltas = deltas[0], deltas[1:]
+    if not deltas:
+        return cube
+
+    keys = {'cube': CUBE_DIMENSIONS, 'customers': ['Customer ID']}
+    combined = {}
+    for name in deltas[0]:
+        stacked = pd.concat([cube[name]] + [delta[name] for delta in deltas], ignore_index=True)
+        combined[name] = stacked.groupby(keys[name], observed=True, as_index=False).sum()
+    return combined
+
+# Function to save the cube
+def save_cube(cube, dirpath, file_extension='.parquet', watermark=None):
+    """
+    Save the cube tables into a directory next to the transformed data.
+    Each table is written atomically (see etl_automation.atomic_output).
+    Tables missing from cube are left as they are, e.g. the customers
+    table the out-of-core backend writes itself.
+
+    The previous watermark is removed before any table is written and the
+    new one written last, so a cube saved without one, or only partly
+    saved, is never mistaken for an incrementally updated one.
+
+    Args:
+    - cube (dict): Cube from build_cube or update_cube.
+    - dirpath (str): Directory to save the tables in.
+    - file_extension (str): '.parquet' or '.pkl'.
+    - watermark (dict, optional): Watermark of the transactions in the cube.
+
+    Returns:
+    - bool: True if every table was saved.
+    """
+    # Imported here: etl_automation imports this module
+    from etl_automation import atomic_output
+    try:
+        os.makedirs(dirpath, exist_ok=True)
+        watermark_filepath = os.path.join(dirpath, CUBE_WATERMARK_FILE)
+        if os.path.exists(watermark_filepath):
+            os.remove(watermark_filepath)
+        for name, filename in CUBE_FILES.items():
+            if name not in cube:
+                continue
+            # Also replaces a table saved as a partitioned dataset by the out-of-core backend
+            with atomic_output(os.path.join(dirpath, filename + file_extension)) as temp_path:
+                if file_extension == '.parquet':
+                    cube[name].to_parquet(temp_path, index=False)
+                else:
+                    cube[name].to_pickle(temp_path)
+        if watermark is not None:
+            with atomic_output(watermark_filepath) as temp_path:
+                with open(temp_path, 'w') as f:
+                    json.dump(watermark, f, indent=2)
+        print("KPI cube saved successfully.")
+        return True
+    except Exception as e:
+        print(f"Error saving KPI cube: {e}")
+        return False
+
+# Function to load a saved cube
+def load_cube(dirpath):
+    """
+    Load a cube saved by save_cube.
+
+    Args:
+    - dirpath (str): Directory the cube was saved in.
+
+    Returns:
+    - dict: The cube, or None if there is no saved cube.
+    """
+    cube = {}
+    for name, filename in CUBE_FILES.items():
+        for file_extension, reader in (('.parquet', pd.read_parquet), ('.pkl', pd.read_pickle)):
+            filepath = os.path.join(dirpath, filename + file_extension)
+            if os.path.exists(filepath):
+                cube[name] = reader(filepath)
+                break
+        else:
+            return None
+    return cube
+
+# Query API answering the analysis notebook's KPIs from the cube
+
+def monthly_sales(cube):
+    """
+    Total sales per month, including months without sales.
+
+    Returns:
+    - Series: Total Amount indexed by monthly Period.
+    """
+    sales = cube['cube'].groupby('Sales Month')['Total Amount'].sum()
+    sales.index = pd.PeriodIndex(sales.index, freq='M')
+    months = pd.period_range(sales.index.min(), sales.index.max(), freq='M')
+    return sales.reindex(months, fill_value=0)
+
+def sales_by(cube, dimension, measure='Total Amount'):
+    """
+    Total of a measure per value of one dimension, e.g. sales by 'Season',
+    'Gender' or 'Product Category', or transaction counts with
+    measure='Transactions'.
+
+    Returns:
+    - Series: The measure indexed by dimension value.
+    """
+    return cube['cube'].groupby(dimension, observed=True)[measure].sum()
+
+def top_customers(cube, n=10):
+    """
+    The n customers with the highest total spend.
+
+    Returns:
+    - Series: Total Amount indexed by Customer ID, highest first.
+    """
+    return cube['customers'].nlargest(n, 'Total Amount').set_index('Customer ID')['Total Amount']
+
+def average_spend_per_customer(cube):
+    """
+    Average transaction value of each customer.
+
+    Returns:
+    - Series: Mean Total Amount indexed by Customer ID.
+    """
+    customers = cube['customers'].set_index('Customer ID')
+    return customers['Total Amount'] / customers['Transactions']
+
+def transaction_frequency(cube):
+    """
+    Number of transactions made by each customer.
+
+    Returns:
+    - Series: Transaction count indexed by Customer ID, highest first.
+    """
+    return cube['customers'].set_index('Customer ID')['Transactions'].sort_values(ascending=False)
@@ -0,0 +1,353 @@
+import os
+import re
+import sys
+import glob
+import gzip
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from itertools import chain
+import pandas as pd
+from log_monitor import (LOG_FILEPATH, RUN_GAP_SECONDS, parse_log_line, advance_run,
+                         resume_log_follower, read_new_lines)
+
+# Indexed store of every line of data_pipeline.log, grouped into runs, so
+# historical questions are answered from indexes instead of rescanning the log
+LOG_INDEX_DB_PATH = 'log_index.db'
+# Events inserted per executemany batch
+INDEX_BATCH_SIZE = 50_000
+# Event times are stored as seconds since this (naive) epoch
+EPOCH = datetime(1970, 1, 1)
+
+# ERROR messages reporting a failed validation
+VALIDATION_FAILURE_PATTERN = re.compile(r'validation failed', re.IGNORECASE)
+
+# Distinct messages are stored once and referenced by ID, which keeps the
+# event table to a few numbers per line. log_run_keys maps the run IDs of
+# structured stage events to the integer run IDs used here
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_messages (
+    message_id INTEGER PRIMARY KEY,
+    message TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS log_events (
+    time REAL NOT NULL,
+    level TEXT NOT NULL,
+    stage TEXT,
+    run_id INTEGER,
+    duration REAL,
+    message_id INTEGER NOT NULL REFERENCES log_messages(message_id)
+);
+CREATE TABLE IF NOT EXISTS log_runs (
+    run_id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    stages INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    validation_failures INTEGER NOT NULL,
+    completed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS log_run_keys (
+    run_key TEXT PRIMARY KEY,
+    run_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS log_index_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    inode INTEGER,
+    offset INTEGER,
+    run TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_log_events_stage_time ON log_events(stage, time) WHERE stage IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_log_events_time ON log_events(time);
+CREATE INDEX IF NOT EXISTS idx_log_events_run_id ON log_events(run_id);
+CREATE INDEX IF NOT EXISTS idx_log_runs_started_at ON log_runs(started_at);
+"""
+
+# Function to open the log index
+def connect(db_path=LOG_INDEX_DB_PATH):
+    """
+    Open the log index, creating its tables on first use.
+
+    Args:
+    - db_path (str): Log index database path.
+
+    Returns:
+    - Connection: An open sqlite3 connection.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+# Helper converting a time to the stored seconds
+def _to_seconds(value):
+    return (pd.Timestamp(value).to_pydatetime() - EPOCH).total_seconds()
+
+# Helper converting stored seconds back to times
+def _to_times(seconds):
+    return pd.to_datetime(seconds, unit='s').dt.round('ms')
+
+# Helper loading the position and open run the last indexing stopped at
+def _load_index_state(conn):
+    row = conn.execute("SELECT inode, offset, run FROM log_index_state WHERE id = 1").fetchone()
+    if row is None:
+        return None, None
+    run = json.loads(row[2]) if row[2] else None
+    if run is not None:
+        run['stages'] = set(run['stages'])
+        run['last_time'] = datetime.fromisoformat(run['last_time'])
+    return {'inode': row[0], 'offset': row[1]}, run
+
+# Helper recording the position and open run, in the indexing transaction
+def _save_index_state(conn, follower, run):
+    saved_run = None
+    if run is not None:
+        saved_run = json.dumps({**run, 'stages': sorted(run['stages']),
+                                'last_time': run['last_time'].isoformat()})
+    conn.execute("INSERT OR REPLACE INTO log_index_state (id, inode, offset, run) VALUES (1, ?, ?, ?)",
+                 (follower['inode'], follower['offset'], saved_run))
+
+# Helper returning the summary of a run, loading it if it was indexed earlier
+def _run_summary(conn, runs, run_id, seconds):
+    if run_id not in runs:
+        row = conn.execute("SELECT started_at, finished_at, stages, errors, validation_failures, completed "
+                           "FROM log_runs WHERE run_id = ?", (run_id,)).fetchone()
+        runs[run_id] = list(row) if row is not None else [seconds, seconds, 0, 0, 0, 0]
+    return runs[run_id]
+
+# Helper listing rotated backups of the log, oldest first
+def _rotated_backups(filepath):
+    backups = []
+    for path in glob.glob(glob.escape(filepath) + '.*'):
+        suffix = path[len(filepath) + 1:].removesuffix('.gz')
+        if suffix.isdigit():
+            backups.append((int(suffix), path))
+    # RotatingFileHandler numbers backups from the newest (.1) up
+    return [path for _, path in sorted(backups, reverse=True)]
+
+# Helper reading the lines of a rotated backup
+def _read_backup(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            yield line.rstrip('\r\n')
+
+# Function to add log lines to the index
+def index_log(filepath=LOG_FILEPATH, db_path=LOG_INDEX_DB_PATH):
+    """
+    Parse the log lines not indexed yet into the log index. The first call
+    bulk loads the rotated backups (data_pipeline.log.N, gzipped or not,
+    oldest first) and the whole log; later calls only read the lines
+    appended since, resuming from the recorded inode and offset as the log
+    monitor does.
+
+    Structured stage events are grouped into runs by their run ID and keep
+    their logged duration, so runs interleaved by the scheduler stay apart;
+    a failed validate_* stage counts as a validation failure. Logs written
+    before stages logged events are grouped with the monitor's rule
+    instead, timing stages by the gaps between STAGE_MESSAGES lines. Other
+    lines are tagged with the run of the latest stage event while they are
+    within RUN_GAP_SECONDS of it.
+
+    Args:
+    - filepath (str): Log file path.
+    - db_path (str): Log index database path.
+
+    Returns:
+    - int: Number of lines indexed, or None if indexing failed.
+    """
+    try:
+        with closing(connect(db_path)) as conn, conn:
+            state, run = _load_index_state(conn)
+            follower = resume_log_follower(filepath, state, from_start=True)
+            if follower is None:
+                return 0
+
+            message_ids = dict(conn.execute("SELECT message, message_id FROM log_messages"))
+            run_ids = dict(conn.execute("SELECT run_key, run_id FROM log_run_keys"))
+            # Once stages log structured events, STAGE_MESSAGES lines are plain messages
+            structured = bool(run_ids)
+            next_run_id = (conn.execute("SELECT MAX(run_id) FROM log_runs").fetchone()[0] or 0) + 1
+            runs = {}
+            batch = []
+            indexed = 0
+
+            lines = read_new_lines(follower, filepath)
+            if state is None:
+                sources = [_read_backup(path) for path in _rotated_backups(filepath)]
+                lines = chain(*sources, lines)
+
+            for line in lines:
+                event = parse_log_line(line)
+                if event is None:
+                    continue
+                seconds = (event['time'] - EPOCH).total_seconds()
+                if event['run_id'] is not None:
+                    run_id = run_ids.get(event['run_id'])
+                    if run_id is None:
+                        if not structured and run is not None and \
+                                (event['time'] - run['last_time']).total_seconds() <= RUN_GAP_SECONDS:
+                            # The stage messages before the first stage event
+                            # belong to its run; its events count the stages
+                            run_id = run['run_id']
+                            _run_summary(conn, runs, run_id, seconds)[2] = 0
+                        else:
+                            run_id = next_run_id
+                            next_run_id += 1
+                        run_ids[event['run_id']] = run_id
+                        conn.execute("INSERT INTO log_run_keys (run_key, run_id) VALUES (?, ?)",
+                                     (event['run_id'], run_id))
+                    structured = True
+                    run = {'run_id': run_id, 'stages': {event['stage']}, 'last_stage': event['stage'],
+                           'last_time': event['time']}
+                elif event['stage'] is not None and not structured:
+                    run = advance_run(run, event)
+                    if 'run_id' not in run:
+                        run['run_id'] = next_run_id
+                        next_run_id += 1
+                else:
+                    event['stage'] = None
+                    if run is not None and (event['time'] - run['last_time']).total_seconds() > RUN_GAP_SECONDS:
+                        run = None
+                run_id = run['run_id'] if run is not None else None
+
+                if run_id is not None:
+                    # A stage event is logged when the stage ends
+                    started = seconds - (event['duration'] if event['run_id'] is not None else 0)
+                    summary = _run_summary(conn, runs, run_id, started)
+                    summary[0] = min(summary[0], started)
+                    summary[1] = max(summary[1], seconds)
+                    if event['stage'] is not None:
+                        summary[2] += 1
+                    if event['run_id'] is not None:
+                        if not event['success'] and event['stage'].startswith('validate'):
+                            summary[4] += 1
+                        summary[5] = summary[5] or int(event['stage'] == 'save_transformed' and event['success'])
+                    elif event['stage'] is not None:
+                        summary[5] = summary[5] or int(event['stage'] == 'save_transformed')
+                    if event['level'] == 'ERROR':
+                        summary[3] += 1
+                        if not structured:
+                            summary[4] += bool(VALIDATION_FAILURE_PATTERN.search(event['message']))
+
+                message_id = message_ids.get(event['message'])
+                if message_id is None:
+                    message_id = conn.execute("INSERT INTO log_messages (message) VALUES (?)",
+                                              (event['message'],)).lastrowid
+                    message_ids[event['message']] = message_id
+                batch.append((seconds, event['level'], event['stage'], run_id, event['duration'], message_id))
+                indexed += 1
+                if len(batch) >= INDEX_BATCH_SIZE:
+                    conn.executemany("INSERT INTO log_events VALUES (?, ?, ?, ?, ?, ?)", batch)
+                    batch.clear()
+
+            conn.executemany("INSERT INTO log_events VALUES (?, ?, ?, ?, ?, ?)", batch)
+            conn.executemany("INSERT OR REPLACE INTO log_runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             [(run_id, *summary) for run_id, summary in runs.items()])
+            _save_index_state(conn, follower, run)
+            follower['file'].close()
+        print(f"Indexed {indexed} log lines into {db_path}.")
+        return indexed
+    except Exception as e:
+        print(f"Error indexing {filepath}: {e}")
+        return None
+
+# Function to compute a percentile of a stage's duration per day
+def stage_duration_percentiles(stage='clean', q=0.95, days=90, end=None, db_path=LOG_INDEX_DB_PATH):
+    """
+    A percentile of a stage's duration for each day, e.g. the p95 clean
+    duration per day over the last 90 days. Only the stage's events in the
+    range are read, through the (stage, time) index.
+
+    Args:
+    - stage (str): Stage name, e.g. 'clean' or 'validate_cleaned'.
+    - q (float): Percentile, between 0 and 1.
+    - days (int): Number of days before end.
+    - end (datetime-like, optional): End of the range. Defaults to now.
+    - db_path (str): Log index database path.
+
+    Returns:
+    - Series: The percentile duration in seconds, indexed by day.
+    """
+    end = pd.Timestamp.now() if end is None else pd.Timestamp(end)
+    start = end - pd.Timedelta(days=days)
+    with closing(connect(db_path)) as conn:
+        df = pd.read_sql_query(
+            "SELECT time, duration FROM log_events "
+            "WHERE stage = ? AND time >= ? AND time <= ? AND duration IS NOT NULL",
+            conn, params=(stage, _to_seconds(start), _to_seconds(end)))
+    day = _to_times(df['time']).dt.normalize().rename('day')
+    return df['duration'].astype(float).groupby(day).quantile(q).rename(f"{stage} p{q * 100:g}")
+
+# Function to load the indexed runs
+def load_runs(start=None, end=None, validation_failures=False, db_path=LOG_INDEX_DB_PATH):
+    """
+    Load the runs that started between start and end.
+
+    Args:
+    - start (datetime-like, optional): Earliest run start time.
+    - end (datetime-like, optional): Latest run start time.
+    - validation_failures (bool): Only return runs with a failed validation.
+    - db_path (str): Log index database path.
+
+    Returns:
+    - DataFrame: One row per run, ordered by start time.
+    """
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append("started_at >= ?")
+        params.append(_to_seconds(start))
+    if end is not None:
+        conditions.append("started_at <= ?")
+        params.append(_to_seconds(end))
+    if validation_failures:
+        conditions.append("validation_failures > 0")
+
+    query = "SELECT * FROM log_runs"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY started_at"
+
+    with closing(connect(db_path)) as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+    df['started_at'] = _to_times(df['started_at'])
+    df['finished_at'] = _to_times(df['finished_at'])
+    df['completed'] = df['completed'].astype(bool)
+    return df
+
+# Function to find the runs with failed validations
+def runs_with_validation_failures(start=None, end=None, db_path=LOG_INDEX_DB_PATH):
+    return load_runs(start, end, validation_failures=True, db_path=db_path)
+
+# Function to load every line of one run
+def run_timeline(run_id, db_path=LOG_INDEX_DB_PATH):
+    """
+    Load the log lines of one run in order.
+
+    Args:
+    - run_id (int): Run ID from load_runs.
+    - db_path (str): Log index database path.
+
+    Returns:
+    - DataFrame: time, level, stage, duration and message of each line.
+    """
+    with closing(connect(db_path)) as conn:
+        df = pd.read_sql_query(
+            "SELECT e.time, e.level, e.stage, e.duration, m.message FROM log_events e "
+            "JOIN log_messages m USING (message_id) WHERE e.run_id = ? ORDER BY e.time",
+            conn, params=(run_id,))
+    df['time'] = _to_times(df['time'])
+    return df
+
+if __name__ == "__main__":
+    # Index data_pipeline.log (or the log given) and summarise its history
+    log_filepath = sys.argv[1] if len(sys.argv) > 1 else LOG_FILEPATH
+    if index_log(log_filepath) is not None and os.path.exists(LOG_INDEX_DB_PATH):
+        runs = load_runs()
+        print(f"{len(runs)} runs indexed, {int(runs['completed'].sum())} completed.")
+        print("Runs with validation failures:")
+        print(runs_with_validation_failures())
+        print("p95 clean duration per day over the last 90 days:")
+        print(stage_duration_percentiles('clean', 0.95, days=90))
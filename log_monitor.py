@@ -1,21 +1,23 @@
 import pandas as pd
 import os
+import re
+import sys
+import json
+import glob
+import statistics
 import time  # Importing time for tracking duration
-from logger_setup import logger  # Importing the configured logger
-
-# Global variables for monitoring
-metrics = {
-    'load_time': [],
-    'clean_time': [],
-    'transform_time': [],
-    'load_success': 0,
-    'clean_success': 0,
-    'transform_success': 0
-}
+from collections import deque
+from datetime import datetime
+from logger_setup import logger, LOG_FILEPATH  # Importing the configured logger
+from background_save import start_background_save, finish_background_save
+from etl_automation import add_calendar_features, atomic_output
+from metrics_store import start_run, record_stage, finish_run, file_size, load_stage_metrics
+
 
 # Function to load data
 def load_data(filepath):
-    start_time = time.time()  # Start timing
+    start_time = time.perf_counter()  # Start timing
+    df = None
     try:
         _, file_extension = os.path.splitext(filepath)
         if file_extension == '.csv':
@@ -28,7 +30,6 @@ def load_data(filepath):
         
         if df is not None:
             logger.info("Data loaded successfully.")
-            metrics['load_success'] += 1
         else:
             logger.warning("Warning: Loaded data is None.")
         return df
@@ -36,11 +37,14 @@ def load_data(filepath):
         logger.error(f"Error loading data: {e}")
         return None
     finally:
-        metrics['load_time'].append(time.time() - start_time)  # Log load time
+        record_stage('load', time.perf_counter() - start_time, success=df is not None,
+                     rows=None if df is None else len(df), bytes_read=file_size(filepath))
 
 # Function for cleaning the data
 def clean_data(df):
-    start_time = time.time()  # Start timing
+    start_time = time.perf_counter()  # Start timing
+    rows_in = len(df)
+    success = False
     try:
         # Handle missing values
         df.dropna(inplace=True)
@@ -60,11 +64,12 @@ def clean_data(df):
         df = df[(df['Quantity'] > 0) & (df['Price per Unit'] > 0)]
 
         logger.info("Data cleaned successfully.")
-        metrics['clean_success'] += 1
+        success = True
     except Exception as e:
         logger.error(f"Error cleaning data: {e}")
     finally:
-        metrics['clean_time'].append(time.time() - start_time)  # Log clean time
+        record_stage('clean', time.perf_counter() - start_time, success=success, rows=len(df),
+                     rows_in=rows_in)
         return df
     
 # Function to validate cleaned data
@@ -100,46 +105,41 @@ def save_cleaned_data(df, cleaned_filepath):
     - df (DataFrame): The DataFrame to save.
     - cleaned_filepath (str): Path to save the cleaned data.
     """
+    start_time = time.perf_counter()
+    success = False
     try:
-        df.to_pickle(cleaned_filepath)
+        with atomic_output(cleaned_filepath) as temp_path:
+            df.to_pickle(temp_path)
         logger.info("Cleaned data saved successfully.")
+        success = True
     except Exception as e:
-        logger.error(f"Error saving cleaned data: {e}")    
+        logger.error(f"Error saving cleaned data: {e}")
+    finally:
+        record_stage('save_cleaned', time.perf_counter() - start_time, success=success,
+                     rows=len(df), rows_in=len(df), bytes_written=file_size(cleaned_filepath))
 
 # Function for transforming the data
 def transform_data(df):
-    start_time = time.time()  # Start timing
+    start_time = time.perf_counter()  # Start timing
+    success = False
     if df is None:
         logger.error("Error: DataFrame is None. Transformation skipped.")
         return None
     try:
         # (Transformation code as before)
-        # Create a Day of Week column
-        df['Day of Week'] = df['Date'].dt.day_name()
-        # Example transformation: Add a 'Season' column based on 'Date'
-        df['Month'] = df['Date'].dt.month
-
-        def get_season(month):
-            if month in [12, 1, 2]:
-                return 'Winter'
-            elif month in [3, 4, 5]:
-                return 'Spring'
-            elif month in [6, 7, 8]:
-                return 'Summer'
-            else:
-                return 'Fall'
-
-        df['Season'] = df['Month'].apply(get_season)
+        # Add 'Day of Week', 'Month' and 'Season' columns based on 'Date'
+        add_calendar_features(df)
 
         # Add a derived column, Revenue
         df['Revenue'] = df['Quantity'] * df['Price per Unit']        
 
         logger.info("Data transformed successfully.")
-        metrics['transform_success'] += 1
+        success = True
     except Exception as e:
         logger.error(f"Error transforming data: {e}")
     finally:
-        metrics['transform_time'].append(time.time() - start_time)  # Log transform time
+        record_stage('transform', time.perf_counter() - start_time, success=success, rows=len(df),
+                     rows_in=len(df))
         return df
 
 # Function to validate transformed data
@@ -176,25 +176,35 @@ def save_transformed_data(df, transformed_filepath):
     - df (DataFrame): The DataFrame to save.
     - transformed_filepath (str): Path to save the transformed data.
     """
+    start_time = time.perf_counter()
+    success = False
     try:
-        df.to_pickle(transformed_filepath)
+        with atomic_output(transformed_filepath) as temp_path:
+            df.to_pickle(temp_path)
         logger.info("Transformed data saved successfully.")
+        success = True
     except Exception as e:
         logger.error(f"Error saving transformed data: {e}")
+    finally:
+        record_stage('save_transformed', time.perf_counter() - start_time, success=success,
+                     rows=len(df), rows_in=len(df), bytes_written=file_size(transformed_filepath))
 
 
 # Function to print monitoring results
-def print_monitoring_results():
+def print_monitoring_results(run_id):
     logger.info("Monitoring Results:")
-    logger.info(f"Load Times: {metrics['load_time']}")
-    logger.info(f"Clean Times: {metrics['clean_time']}")
-    logger.info(f"Transform Times: {metrics['transform_time']}")
-    logger.info(f"Load Successes: {metrics['load_success']}")
-    logger.info(f"Clean Successes: {metrics['clean_success']}")
-    logger.info(f"Transform Successes: {metrics['transform_success']}")
+    for stage in load_stage_metrics(run_id=run_id).itertuples():
+        status = "succeeded" if stage.success else "failed"
+        logger.info(f"{stage.stage}: {status} in {stage.duration:.3f}s, rows={stage.rows}, "
+                    f"bytes read={stage.bytes_read}, bytes written={stage.bytes_written}, "
+                    f"peak memory={stage.peak_memory_mb:.1f} MB")
 
 # Main function to run the data pipeline
-def main(input_filepath, cleaned_filepath, transformed_filepath):
+def main(input_filepath, cleaned_filepath, transformed_filepath, persist_cleaned=True):
+    # Each stage records its own metrics against this run
+    run_id = start_run('log_monitor')
+    status = 'failed'
+
     # Load the initial data
     df = load_data(input_filepath)
     if df is not None:
@@ -203,28 +213,394 @@ def main(input_filepath, cleaned_filepath, transformed_filepath):
         
         # Validate cleaned data
         if validate_cleaned_data(cleaned_df):
-            # Save cleaned data
-            save_cleaned_data(cleaned_df, cleaned_filepath)
+            # Save cleaned data in the background while transforming
+            save_handle = None
+            if persist_cleaned:
+                save_handle = start_background_save(save_cleaned_data, cleaned_df, cleaned_filepath)
+
+            # Transform a copy so the background save sees the cleaned frame unchanged
+            transformed_df = transform_data(cleaned_df.copy(deep=False))
             
-            # Load cleaned data for transformation
-            cleaned_df = load_data(cleaned_filepath)
-            if cleaned_df is not None:
-                # Transform the data
-                transformed_df = transform_data(cleaned_df)
-                
-                # Validate transformed data
-                if validate_transformed_data(transformed_df):
-                    # Save the transformed data
-                    save_transformed_data(transformed_df, transformed_filepath)
+            # Validate transformed data
+            if validate_transformed_data(transformed_df):
+                # Save the transformed data
+                save_transformed_data(transformed_df, transformed_filepath)
+                status = 'success'
+
+            finish_background_save(save_handle)
+    finish_run(status)
 
     # Print monitoring results
-    print_monitoring_results()
+    print_monitoring_results(run_id)
+
+# Log monitoring settings; the log itself is LOG_FILEPATH from logger_setup
+# Where the monitor records how far into the log it has read
+MONITOR_STATE_PATH = 'log_monitor_state.json'
+# Seconds between checks for new log lines
+POLL_INTERVAL = 1.0
+
+# Lines written by logger_setup: 'asctime - levelname - message'
+LOG_LINE_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) - ([A-Z]+) - (.*)$')
+# Text message of a structured stage event (see logger_setup.log_stage_event)
+STAGE_EVENT_PATTERN = re.compile(r'^Stage (\S+) (finished|failed) in ([\d.]+) ms \(run (\w+),')
+
+# Messages marking the end of each pipeline stage in logs written before
+# stages logged structured events; only used to time stages of such logs
+STAGE_MESSAGES = {
+    'Data loaded successfully.': 'load',
+    'Data cleaned successfully.': 'clean',
+    'Cleaned data validation passed.': 'validate_cleaned',
+    'Cleaned data saved successfully.': 'save_cleaned',
+    'Data transformed successfully.': 'transform',
+    'Transformed data validation passed.': 'validate_transformed',
+    'Transformed data saved successfully.': 'save_transformed',
+}
+# Stage events further apart than this belong to different runs
+RUN_GAP_SECONDS = 300
+
+# Alert when this many ERROR lines are logged within the window
+ERROR_BURST_COUNT = 5
+ERROR_BURST_WINDOW_SECONDS = 60
+
+# Alert when a stage takes LATENCY_ALERT_FACTOR times its median over the
+# last BASELINE_SIZE runs; stages faster than LATENCY_MIN_SECONDS are ignored
+BASELINE_SIZE = 50
+BASELINE_MIN_SAMPLES = 10
+LATENCY_ALERT_FACTOR = 3.0
+LATENCY_MIN_SECONDS = 1.0
+
+# Function to parse a log line into a structured event
+def parse_log_line(line):
+    """
+    Parse one 'asctime - levelname - message' line, or one JSON line
+    written with logger_setup's 'json' log format.
+
+    Structured stage events carry their stage, run ID, duration and
+    success, from the JSON fields or the text summary. A STAGE_MESSAGES
+    line only names the stage it ends: its duration is left to the caller
+    (see advance_run), and its run ID is None.
+
+    Args:
+    - line (str): A line of data_pipeline.log.
+
+    Returns:
+    - dict: 'time', 'level', 'message', 'stage' (None for messages that
+      do not end a stage), 'run_id', 'duration' (seconds) and 'success',
+      or None for lines in another format, such as traceback lines.
+    """
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+            event = {'time': datetime.fromisoformat(record['time']), 'level': record['level'],
+                     'message': record['message'], 'stage': STAGE_MESSAGES.get(record['message']),
+                     'run_id': None, 'duration': None, 'success': None}
+            if record.get('event') == 'stage':
+                event.update({'stage': record['stage'], 'run_id': record['run_id'],
+                              'duration': record['duration_ms'] / 1000, 'success': bool(record['success'])})
+            return event
+        except (ValueError, KeyError, TypeError):
+            return None
+    match = LOG_LINE_PATTERN.match(line)
+    if match is None:
+        return None
+    timestamp, milliseconds, level, message = match.groups()
+    # fromisoformat is far faster than strptime on large logs
+    event = {'time': datetime.fromisoformat(f"{timestamp}.{milliseconds}"), 'level': level,
+             'message': message, 'stage': STAGE_MESSAGES.get(message), 'run_id': None, 'duration': None,
+             'success': None}
+    if message.startswith('Stage '):
+        stage_match = STAGE_EVENT_PATTERN.match(message)
+        if stage_match is not None:
+            stage, outcome, duration_ms, run_id = stage_match.groups()
+            event.update({'stage': stage, 'run_id': run_id, 'duration': float(duration_ms) / 1000,
+                          'success': outcome == 'finished'})
+    return event
+
+# Function to decide whether a stage event starts a new run
+def starts_new_run(run, event):
+    """
+    Decide whether a stage event belongs to a new run. A run starts when
+    data is loaded, or after a gap of more than RUN_GAP_SECONDS.
+
+    Args:
+    - run (dict or None): The current run's 'stages' (set), 'last_stage'
+      and 'last_time' (of its last stage event).
+    - event (dict): Stage event from parse_log_line.
+
+    Returns:
+    - bool: True if the event starts a new run.
+    """
+    if run is None or (event['time'] - run['last_time']).total_seconds() > RUN_GAP_SECONDS:
+        return True
+    # Older pipelines reloaded the saved cleaned data before transforming it
+    reload = run['last_stage'] == 'save_cleaned' and 'transform' not in run['stages']
+    return event['stage'] == 'load' and not reload
+
+# Function to add a stage event to the current run
+def advance_run(run, event):
+    """
+    Add a stage event to the current run, or start a new run with it, and
+    set event['duration'] to the seconds since the run's previous stage
+    event (None for the first stage of a run).
+
+    Args:
+    - run (dict or None): The current run, as in starts_new_run.
+    - event (dict): Stage event from parse_log_line.
+
+    Returns:
+    - dict: The run the event belongs to.
+    """
+    event['duration'] = None
+    if starts_new_run(run, event):
+        run = {'stages': set(), 'last_stage': None, 'last_time': None}
+    else:
+        event['duration'] = (event['time'] - run['last_time']).total_seconds()
+    run['stages'].add(event['stage'])
+    run['last_stage'] = event['stage']
+    run['last_time'] = event['time']
+    return run
+
+# Function to set the duration of stage events
+def stage_timer():
+    """
+    Return a function that makes sure each event ending a stage has its
+    duration. Structured stage events carry theirs, which holds even when
+    runs interleave. Once one has been seen, STAGE_MESSAGES lines are
+    treated as plain messages, so stages are not counted twice; before
+    that, their durations are inferred with advance_run.
+    """
+    current = {'run': None, 'structured': False}
+
+    def time_stage(event):
+        if event['run_id'] is not None:
+            current['structured'] = True
+        elif event['stage'] is not None:
+            if current['structured']:
+                event['stage'] = None
+            else:
+                current['run'] = advance_run(current['run'], event)
+        return event
+    return time_stage
+
+# Function to create the state of the anomaly detectors
+def new_detectors():
+    """
+    Create empty detector state. All of it is bounded: recent error times
+    within the burst window and the last BASELINE_SIZE durations per stage.
+
+    Returns:
+    - dict: Detector state for check_event.
+    """
+    return {'errors': deque(maxlen=ERROR_BURST_COUNT), 'burst_alerted_at': None,
+            'durations': {}}
+
+# Function to check an event for anomalies
+def check_event(detectors, event):
+    """
+    Update the detectors with an event and return any alerts it raises.
+
+    Args:
+    - detectors (dict): State from new_detectors.
+    - event (dict): Event from parse_log_line, with 'duration' set.
+
+    Returns:
+    - list: Alert messages.
+    """
+    alerts = []
+    if event['level'] in ('ERROR', 'CRITICAL'):
+        errors = detectors['errors']
+        errors.append(event['time'])
+        burst = len(errors) == ERROR_BURST_COUNT and \
+            (errors[-1] - errors[0]).total_seconds() <= ERROR_BURST_WINDOW_SECONDS
+        # Alert once per burst rather than on every further error
+        alerted_at = detectors['burst_alerted_at']
+        if burst and (alerted_at is None or (event['time'] - alerted_at).total_seconds() > ERROR_BURST_WINDOW_SECONDS):
+            detectors['burst_alerted_at'] = event['time']
+            alerts.append(f"{ERROR_BURST_COUNT} errors within {ERROR_BURST_WINDOW_SECONDS}s, "
+                          f"latest at {event['time']}: {event['message']}")
+
+    if event.get('duration') is not None:
+        baseline = detectors['durations'].setdefault(event['stage'], deque(maxlen=BASELINE_SIZE))
+        if len(baseline) >= BASELINE_MIN_SAMPLES:
+            median = statistics.median(baseline)
+            if event['duration'] >= LATENCY_MIN_SECONDS and event['duration'] > LATENCY_ALERT_FACTOR * median:
+                alerts.append(f"{event['stage']} took {event['duration']:.1f}s at {event['time']}, "
+                              f"{event['duration'] / max(median, 1e-9):.1f}x its median of {median:.2f}s "
+                              f"over the last {len(baseline)} runs")
+        baseline.append(event['duration'])
+    return alerts
+
+# Helper reading the complete lines after the follower's offset
+def _read_lines(follower):
+    follower['file'].seek(follower['offset'])
+    for line in follower['file']:
+        # Leave a partly written last line for the next poll
+        if not line.endswith(b'\n'):
+            break
+        follower['offset'] += len(line)
+        yield line.decode('utf-8', errors='replace').rstrip('\r\n')
+
+# Helper opening a log file for following
+def _open_follower(filepath, offset=0):
+    f = open(filepath, 'rb')
+    return {'file': f, 'inode': os.fstat(f.fileno()).st_ino, 'offset': offset}
+
+# Function to start following a log file where the last monitor left off
+def open_log_follower(filepath=LOG_FILEPATH, state_path=MONITOR_STATE_PATH, from_start=False):
+    """
+    Open the log at the offset recorded by the last monitor run. If the log
+    was rotated in the meantime and the old file still exists uncompressed
+    next to it (e.g. data_pipeline.log.1), the rest of the old file is read
+    first. Without a recorded offset, following starts at the end of the
+    log, unless from_start is set.
+
+    Args:
+    - filepath (str): Log file path.
+    - state_path (str): Monitor state file.
+    - from_start (bool): Read an unknown log from its start.
+
+    Returns:
+    - dict: Follower to pass to read_new_lines, or None if the log does not
+      exist yet.
+    """
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = None
+    return resume_log_follower(filepath, state, from_start)
+
+# Function to start following a log file from a recorded position
+def resume_log_follower(filepath, state, from_start=False):
+    """
+    Open the log at a recorded position, as described in open_log_follower.
+
+    Args:
+    - filepath (str): Log file path.
+    - state (dict or None): 'inode' and 'offset' reached by the last reader.
+    - from_start (bool): Read an unknown log from its start.
+
+    Returns:
+    - dict: Follower to pass to read_new_lines, or None if the log does not
+      exist yet.
+    """
+    if not os.path.exists(filepath):
+        return None
+
+    follower = _open_follower(filepath)
+    if state is None:
+        follower['offset'] = 0 if from_start else os.fstat(follower['file'].fileno()).st_size
+    elif state['inode'] == follower['inode']:
+        follower['offset'] = state['offset']
+    else:
+        for rotated_path in glob.glob(glob.escape(filepath) + '.*'):
+            if os.stat(rotated_path).st_ino == state['inode'] and not rotated_path.endswith('.gz'):
+                follower['rotated'] = _open_follower(rotated_path, state['offset'])
+                break
+    return follower
+
+# Function to read the lines appended to a followed log
+def read_new_lines(follower, filepath=LOG_FILEPATH):
+    """
+    Yield the complete lines appended since the last call. The log file
+    stays open, so lines written just before a rotation are still read
+    from the old file before moving on to the new one. A log truncated in
+    place is read again from its start. Only one line is held at a time.
+
+    Args:
+    - follower (dict): Follower from open_log_follower.
+    - filepath (str): Log file path.
+
+    Yields:
+    - str: The next log line.
+    """
+    if 'rotated' in follower:
+        yield from _read_lines(follower['rotated'])
+        follower.pop('rotated')['file'].close()
+
+    yield from _read_lines(follower)
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        # Rotated away and not recreated yet
+        return
+    if stat.st_ino != follower['inode']:
+        # Rotated: the old file was read to its end above
+        follower['file'].close()
+        follower.update(_open_follower(filepath))
+        yield from _read_lines(follower)
+    elif stat.st_size < follower['offset']:
+        # Truncated in place
+        follower['offset'] = 0
+        yield from _read_lines(follower)
+
+# Helper recording how far into the log the monitor has read
+def _save_monitor_state(follower, state_path):
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump({'inode': follower['inode'], 'offset': follower['offset']}, f)
+    os.replace(state_path + '.tmp', state_path)
+
+# Function to follow the pipeline log and alert on anomalies
+def monitor_log(filepath=LOG_FILEPATH, state_path=MONITOR_STATE_PATH, poll_interval=POLL_INTERVAL,
+                from_start=False, alert=None, max_polls=None):
+    """
+    Follow the pipeline log, turning new lines into structured events and
+    raising alerts on ERROR bursts and slow stages as they are written.
+    Memory use is constant however large the log grows. The read offset is
+    saved after every poll, so a restarted monitor carries on where it
+    stopped instead of rereading the log.
+
+    Args:
+    - filepath (str): Log file path.
+    - state_path (str): Monitor state file.
+    - poll_interval (float): Seconds between polls.
+    - from_start (bool): Read a log the monitor has not seen from its start.
+    - alert (callable, optional): Called with each alert message. Alerts
+      are logged as warnings by default; warnings do not feed back into the
+      detectors.
+    - max_polls (int, optional): Stop after this many polls. Runs until
+      interrupted by default.
+    """
+    alert = alert or (lambda message: logger.warning(f"ALERT: {message}"))
+    detectors = new_detectors()
+    time_stage = stage_timer()
+    follower = None
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            polls += 1
+            if follower is None:
+                follower = open_log_follower(filepath, state_path, from_start)
+            if follower is not None:
+                offset = (follower['inode'], follower['offset'])
+                for line in read_new_lines(follower, filepath):
+                    event = parse_log_line(line)
+                    if event is None:
+                        continue
+                    for message in check_event(detectors, time_stage(event)):
+                        alert(message)
+                if (follower['inode'], follower['offset']) != offset:
+                    _save_monitor_state(follower, state_path)
+            if max_polls is None or polls < max_polls:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        logger.info("Log monitor stopped.")
+    finally:
+        if follower is not None:
+            follower['file'].close()
 
 if __name__ == "__main__":
+    # Run with --follow to monitor data_pipeline.log instead of running the pipeline
+    if len(sys.argv) > 1 and sys.argv[1] == '--follow':
+        monitor_log(LOG_FILEPATH, from_start='--from-start' in sys.argv)
+        sys.exit(0)
+
     # Define file paths
     input_filepath = 'data/retail_sales_dataset.csv'
     cleaned_filepath = 'cleaned_data.pkl'
     transformed_filepath = 'transform_data.pkl'
+    # Set to False to skip writing the intermediate cleaned data
+    persist_cleaned = True
     
     # Run the data pipeline
-    main(input_filepath, cleaned_filepath, transformed_filepath)
+    main(input_filepath, cleaned_filepath, transformed_filepath, persist_cleaned)
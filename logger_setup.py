@@ -1,23 +1,334 @@
+import atexit
+import gzip
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Rollover is serialized across processes with fcntl on POSIX and msvcrt on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Logging settings. Pipeline code only puts records on a queue; a
+# background listener thread formats them and does the file and console
+# I/O, so logging never blocks a stage on disk or terminal writes.
+LOG_FILEPATH = 'data_pipeline.log'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# The file and the console each use the human-readable LOG_FORMAT ('text')
+# or one JSON object per line ('json'), which loads straight into analytics
+# tools, e.g. pd.read_json('data_pipeline.log', lines=True)
+LOG_FORMATS = ('text', 'json')
+# The log is rotated when it grows past LOG_MAX_BYTES or is older than
+# LOG_ROTATE_SECONDS (0 disables either), keeping LOG_BACKUP_COUNT backups:
+# data_pipeline.log.1 (the newest, left uncompressed so the log monitor can
+# finish reading it) and gzipped archives data_pipeline.log.2.gz to .N.gz.
+# The start of the current period is kept in data_pipeline.log.started and
+# rollover is serialized through data_pipeline.log.lock.
+LOG_MAX_BYTES = 10 * 2**20
+LOG_ROTATE_SECONDS = 24 * 3600
+LOG_BACKUP_COUNT = 10
 
 # Set up a logger with custom configuration
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)  # Set the lowest level you want to capture
 
-# File handler to write logs to a file
-file_handler = logging.FileHandler('data_pipeline.log')
-file_handler.setLevel(logging.INFO)  # Adjust as needed
+# The listener and its settings, created on the first logged record
+logging_state = {
+    'listener': None,
+    'pid': None,
+    'log_filepath': LOG_FILEPATH,
+    'max_bytes': LOG_MAX_BYTES,
+    'rotate_seconds': LOG_ROTATE_SECONDS,
+    'backup_count': LOG_BACKUP_COUNT,
+    'compress': True,
+    'file_format': 'text',
+    'console_format': 'text',
+}
+_logging_lock = threading.Lock()
+
+# Context manager holding an exclusive, blocking lock on a file
+@contextmanager
+def _file_lock(lock_path):
+    with open(lock_path, 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+# File handler rotating on size or age, with numbered backups
+class SizeAndTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that also rolls over once the current file is older
+    than rotate_seconds, and gzips the backups older than the newest one.
+    Backups keep RotatingFileHandler's numbering, so the log monitor and
+    log index find them as data_pipeline.log.N[.gz].
+
+    Several processes (e.g. scheduler workers) can write the same log. The
+    start of the period is kept in a sidecar file, as every write refreshes
+    the log's mtime. Rollover happens under a lock file, and a process whose
+    log was rotated by another one reopens the new file instead of
+    rotating it again.
+    """
+    def __init__(self, filename, max_bytes=0, rotate_seconds=0, backup_count=0, compress=True):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.started_filepath = self.baseFilename + '.started'
+        self.lock_filepath = self.baseFilename + '.lock'
+        self.rollover_at = self._next_rollover()
+
+    def _next_rollover(self):
+        if not self.rotate_seconds:
+            return None
+        try:
+            with open(self.started_filepath) as f:
+                started = float(f.read())
+        except (OSError, ValueError):
+            started = time.time()
+            self._save_started(started)
+        return started + self.rotate_seconds
+
+    def _save_started(self, started):
+        temp_filepath = f"{self.started_filepath}.{os.getpid()}.tmp"
+        with open(temp_filepath, 'w') as f:
+            f.write(repr(started))
+        os.replace(temp_filepath, self.started_filepath)
+
+    def _rotated_elsewhere(self):
+        # Whether the open file is no longer the one at baseFilename
+        if self.stream is None:
+            return False
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _reopen(self):
+        self.stream.close()
+        self.stream = None
+        self.rollover_at = self._next_rollover()
+
+    def shouldRollover(self, record):
+        if self._rotated_elsewhere():
+            self._reopen()
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            # Another process may have started a new period already
+            self.rollover_at = self._next_rollover()
+            if time.time() >= self.rollover_at and os.path.exists(self.baseFilename):
+                return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        with _file_lock(self.lock_filepath):
+            # Another process rotated the log while this one waited
+            if self._rotated_elsewhere():
+                self._reopen()
+                return
+            # Not opened yet, so rolling over on age: check the period again
+            if self.stream is None and self.rotate_seconds:
+                self.rollover_at = self._next_rollover()
+                if time.time() < self.rollover_at:
+                    return
+            self._rotate()
+
+    def _rotate(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if self.backupCount > 0:
+            suffix = '.gz' if self.compress else ''
+            # Shift the archives up, dropping the oldest
+            for i in range(self.backupCount - 1, 1, -1):
+                source = f"{self.baseFilename}.{i}{suffix}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.baseFilename}.{i + 1}{suffix}")
+            newest = f"{self.baseFilename}.1"
+            if os.path.exists(newest):
+                if self.backupCount == 1:
+                    os.remove(newest)
+                elif self.compress:
+                    _gzip_file(newest, f"{self.baseFilename}.2.gz")
+                else:
+                    os.replace(newest, f"{self.baseFilename}.2")
+            os.replace(self.baseFilename, newest)
+        if self.rotate_seconds:
+            started = time.time()
+            self._save_started(started)
+            self.rollover_at = started + self.rotate_seconds
+
+# Formatter writing each record as one line of JSON
+class JsonFormatter(logging.Formatter):
+    """
+    Format a record as a JSON object with its time, level and message, plus
+    the fields of a stage event (see log_stage_event).
+    """
+    def format(self, record):
+        event = {'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                 'level': record.levelname, 'message': record.getMessage()}
+        event.update(getattr(record, 'event', {}))
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str)
+
+# Helper creating the formatter of a log format
+def _formatter(log_format):
+    return JsonFormatter() if log_format == 'json' else logging.Formatter(LOG_FORMAT)
+
+# Helper compressing a rotated log into an archive
+def _gzip_file(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest + '.tmp', 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.replace(dest + '.tmp', dest)
+    os.remove(source)
+
+# Queue handler that starts the listener when the first record arrives
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The queue never leaves this process, so the record is passed on
+        # as is and message formatting happens on the listener thread too
+        return record
+
+    def emit(self, record):
+        if logging_state['pid'] != os.getpid():
+            start_logging()
+        super().emit(record)
+
+_queue_handler = LazyQueueHandler(queue.SimpleQueue())
+logger.addHandler(_queue_handler)
+
+# Function to set where and how the log is written
+def configure_logging(log_filepath=None, max_bytes=None, rotate_seconds=None, backup_count=None, compress=None,
+                      file_format=None, console_format=None):
+    """
+    Change the logging settings. Takes effect immediately if records were
+    already logged, otherwise when the first record is.
+
+    Args:
+    - log_filepath (str, optional): Log file path.
+    - max_bytes (int, optional): Rotate once the log is this large; 0 disables.
+    - rotate_seconds (float, optional): Rotate once the log is this old; 0 disables.
+    - backup_count (int, optional): Number of rotated archives to keep.
+    - compress (bool, optional): Gzip rotated logs.
+    - file_format (str, optional): 'text' or 'json' lines in the log file.
+    - console_format (str, optional): 'text' or 'json' lines on the console.
+    """
+    for log_format in (file_format, console_format):
+        if log_format is not None and log_format not in LOG_FORMATS:
+            raise ValueError(f"Unknown log format {log_format!r}, expected one of {LOG_FORMATS}")
+    settings = {'log_filepath': log_filepath, 'max_bytes': max_bytes, 'rotate_seconds': rotate_seconds,
+                'backup_count': backup_count, 'compress': compress,
+                'file_format': file_format, 'console_format': console_format}
+    logging_state.update({name: value for name, value in settings.items() if value is not None})
+    if logging_state['listener'] is not None and logging_state['pid'] == os.getpid():
+        stop_logging()
+        start_logging()
+
+# Function to start the background listener writing the log
+def start_logging():
+    """
+    Create the file and console handlers and start the listener thread that
+    writes queued records to them. Called on the first logged record, and
+    again in a forked child process, whose copy of the listener thread does
+    not run.
+    """
+    with _logging_lock:
+        if logging_state['pid'] == os.getpid():
+            return
+        if logging_state['pid'] is not None:
+            # Forked: the inherited queue may be mid-operation, start afresh
+            _queue_handler.queue = queue.SimpleQueue()
+
+        # File handler to write logs to a file
+        directory = os.path.dirname(logging_state['log_filepath'])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = SizeAndTimeRotatingFileHandler(
+            logging_state['log_filepath'], logging_state['max_bytes'], logging_state['rotate_seconds'],
+            logging_state['backup_count'], logging_state['compress'])
+        file_handler.setLevel(logging.INFO)  # Adjust as needed
+        file_handler.setFormatter(_formatter(logging_state['file_format']))
+
+        # Console handler for on-screen logging
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.DEBUG)
+        console_handler.setFormatter(_formatter(logging_state['console_format']))
+
+        listener = logging.handlers.QueueListener(_queue_handler.queue, file_handler, console_handler,
+                                                  respect_handler_level=True)
+        listener.start()
+        logging_state.update({'listener': listener, 'pid': os.getpid()})
+
+# Function to flush the queued records and stop the listener
+def stop_logging():
+    """
+    Write out every queued record, stop the listener and close the log.
+    Runs automatically at exit; a record logged afterwards starts a new
+    listener.
+    """
+    with _logging_lock:
+        listener = logging_state['listener']
+        if listener is None or logging_state['pid'] != os.getpid():
+            return
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        logging_state.update({'listener': None, 'pid': None})
+
+# Function to check whether stage events are logged
+def stage_events_enabled():
+    """
+    Whether log_stage_event would log anything, so callers can skip
+    measuring what only the event reports (e.g. resident memory).
 
-# Console handler for on-screen logging
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
+    Returns:
+    - bool: True if INFO records are logged.
+    """
+    return logger.isEnabledFor(logging.INFO)
 
-# Custom log format
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
+# Function to log the measurements of one pipeline stage
+def log_stage_event(run_id, stage, duration, success=True, rows_in=None, rows_out=None,
+                    bytes_read=None, bytes_written=None, rss_mb=None):
+    """
+    Log one INFO event per stage, carrying its measurements as fields. In
+    the 'json' format each field is a key of the line; the text format
+    shows a one-line summary. Nothing is built when INFO is disabled, and
+    the message is formatted on the listener thread, not by the stage.
 
-# Adding handlers to the logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+    Args:
+    - run_id (str): Run the stage belongs to.
+    - stage (str): Stage name, e.g. 'load', 'clean', 'transform'.
+    - duration (float): Stage duration in seconds.
+    - success (bool): Whether the stage succeeded.
+    - rows_in (int, optional): Rows the stage received.
+    - rows_out (int, optional): Rows the stage produced.
+    - bytes_read (int, optional): Bytes read from disk.
+    - bytes_written (int, optional): Bytes written to disk.
+    - rss_mb (float, optional): Resident memory of the process after the stage.
+    """
+    if not stage_events_enabled():
+        return
+    duration_ms = round(duration * 1000, 3)
+    event = {'event': 'stage', 'run_id': run_id, 'stage': stage, 'success': success,
+             'rows_in': rows_in, 'rows_out': rows_out, 'duration_ms': duration_ms,
+             'bytes_read': bytes_read, 'bytes_written': bytes_written, 'rss_mb': rss_mb}
+    logger.info("Stage %s %s in %.1f ms (run %s, rows in=%s, rows out=%s)", stage,
+                'finished' if success else 'failed', duration_ms, run_id, rows_in, rows_out, extra={'event': event})
 
+atexit.register(stop_logging)
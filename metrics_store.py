@@ -0,0 +1,231 @@
+import os
+import resource
+import sqlite3
+import sys
+import time
+import uuid
+from contextlib import closing
+import pandas as pd
+from logger_setup import log_stage_event, stage_events_enabled
+
+# Durable, append-only store of ETL run metrics, shared by every run
+METRICS_DB_PATH = 'pipeline_metrics.db'
+
+# The run that record_stage currently attributes metrics to
+current_run = {
+    'run_id': None,
+    'db_path': METRICS_DB_PATH,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    pipeline TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    status TEXT
+);
+CREATE TABLE IF NOT EXISTS stage_metrics (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    stage TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    success INTEGER NOT NULL,
+    rows INTEGER,
+    bytes_read INTEGER,
+    bytes_written INTEGER,
+    peak_memory_mb REAL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_started_at ON runs(started_at);
+CREATE INDEX IF NOT EXISTS idx_stage_metrics_started_at ON stage_metrics(started_at, stage);
+CREATE INDEX IF NOT EXISTS idx_stage_metrics_run_id ON stage_metrics(run_id);
+"""
+
+# Function to open the metrics database
+def connect(db_path=None):
+    """
+    Open the metrics database, creating its tables on first use.
+
+    Args:
+    - db_path (str, optional): Database path. Defaults to the current run's.
+
+    Returns:
+    - Connection: An open sqlite3 connection.
+    """
+    conn = sqlite3.connect(db_path or current_run['db_path'])
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+# Function to return the peak memory of this process so far
+def peak_memory_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+# Function to return the current resident memory of this process
+def rss_mb():
+    try:
+        # Resident pages are the second field of /proc/self/statm on Linux
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return peak_memory_mb()
+
+# Function to return a file's size, or None if it is not a file
+def file_size(filepath):
+    try:
+        return os.path.getsize(filepath) if os.path.isfile(filepath) else None
+    except OSError:
+        return None
+
+# Function to start recording a new run
+def start_run(pipeline=None, db_path=METRICS_DB_PATH):
+    """
+    Start a new run; stages recorded afterwards are attributed to it.
+
+    Args:
+    - pipeline (str, optional): Name of the script running the pipeline.
+    - db_path (str): Metrics database path.
+
+    Returns:
+    - str: The new run ID.
+    """
+    run_id = uuid.uuid4().hex
+    with closing(connect(db_path)) as conn, conn:
+        conn.execute("INSERT INTO runs (run_id, pipeline, started_at) VALUES (?, ?, ?)",
+                     (run_id, pipeline, time.time()))
+    current_run.update({'run_id': run_id, 'db_path': db_path})
+    return run_id
+
+# Function to record the metrics of one stage
+def record_stage(stage, duration, success=True, rows=None, bytes_read=None, bytes_written=None, rows_in=None):
+    """
+    Append the metrics of one pipeline stage to the current run, and log
+    them as a structured stage event (see logger_setup.log_stage_event).
+
+    A run is started automatically if none is active. Recording errors are
+    logged to stderr rather than raised so they never fail the pipeline.
+
+    Args:
+    - stage (str): Stage name, e.g. 'load', 'clean', 'transform'.
+    - duration (float): Stage duration in seconds.
+    - success (bool): Whether the stage succeeded.
+    - rows (int, optional): Rows produced by the stage.
+    - bytes_read (int, optional): Bytes read from disk.
+    - bytes_written (int, optional): Bytes written to disk.
+    - rows_in (int, optional): Rows the stage received; logged only.
+    """
+    try:
+        if current_run['run_id'] is None:
+            start_run(db_path=current_run['db_path'])
+        if stage_events_enabled():
+            log_stage_event(current_run['run_id'], stage, duration, success, rows_in, rows,
+                            bytes_read, bytes_written, rss_mb())
+        with closing(connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO stage_metrics (run_id, stage, started_at, duration, success, rows, "
+                "bytes_read, bytes_written, peak_memory_mb) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (current_run['run_id'], stage, time.time() - duration, duration, int(bool(success)),
+                 rows, bytes_read, bytes_written, peak_memory_mb()))
+    except Exception as e:
+        print(f"Error recording {stage} metrics: {e}", file=sys.stderr)
+
+# Function to mark the current run as finished
+def finish_run(status='success'):
+    """
+    Record the end time and status of the current run.
+
+    Args:
+    - status (str): Final status of the run.
+    """
+    if current_run['run_id'] is None:
+        return
+    with closing(connect()) as conn, conn:
+        conn.execute("UPDATE runs SET finished_at = ?, status = ? WHERE run_id = ?",
+                     (time.time(), status, current_run['run_id']))
+    current_run['run_id'] = None
+
+# Function to query stage metrics over a time range
+def load_stage_metrics(start=None, end=None, stages=None, run_id=None, db_path=None):
+    """
+    Load stage metrics recorded between start and end.
+
+    The range is answered from the started_at index, so only the matching
+    rows are read however many runs are stored.
+
+    Args:
+    - start (datetime-like, optional): Earliest stage start time.
+    - end (datetime-like, optional): Latest stage start time.
+    - stages (list, optional): Only return these stages.
+    - run_id (str, optional): Only return this run.
+    - db_path (str, optional): Metrics database path. Defaults to the current run's.
+
+    Returns:
+    - DataFrame: One row per recorded stage, ordered by start time.
+    """
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append("started_at >= ?")
+        params.append(pd.Timestamp(start).timestamp())
+    if end is not None:
+        conditions.append("started_at <= ?")
+        params.append(pd.Timestamp(end).timestamp())
+    if stages:
+        conditions.append(f"stage IN ({', '.join('?' * len(stages))})")
+        params.extend(stages)
+    if run_id is not None:
+        conditions.append("run_id = ?")
+        params.append(run_id)
+
+    query = "SELECT * FROM stage_metrics"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY started_at"
+
+    with closing(connect(db_path)) as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+    df['started_at'] = pd.to_datetime(df['started_at'], unit='s')
+    df['success'] = df['success'].astype(bool)
+    df = df.astype({'rows': 'Int64', 'bytes_read': 'Int64', 'bytes_written': 'Int64'})
+    return df
+
+# Function to build the per-run duration trend of each stage
+def stage_duration_trends(start=None, end=None, stages=('load', 'clean', 'transform'), db_path=None):
+    """
+    Tabulate the duration of each successful stage for every run.
+
+    Args:
+    - start (datetime-like, optional): Earliest stage start time.
+    - end (datetime-like, optional): Latest stage start time.
+    - stages (tuple): Stages to include, one column each.
+    - db_path (str, optional): Metrics database path. Defaults to the current run's.
+
+    Returns:
+    - DataFrame: Indexed by run start time, one duration column per stage.
+    """
+    df = load_stage_metrics(start, end, list(stages), db_path=db_path)
+    df = df[df['success']]
+    run_starts = df.groupby('run_id')['started_at'].transform('min')
+    trends = df.assign(run_started_at=run_starts).pivot_table(
+        index='run_started_at', columns='stage', values='duration', aggfunc='sum')
+    return trends.reindex(columns=list(stages))
+
+# Function to count successful stages
+def stage_success_counts(start=None, end=None, stages=('load', 'clean', 'transform'), db_path=None):
+    """
+    Count the successful executions of each stage.
+
+    Args:
+    - start (datetime-like, optional): Earliest stage start time.
+    - end (datetime-like, optional): Latest stage start time.
+    - stages (tuple): Stages to count.
+    - db_path (str, optional): Metrics database path. Defaults to the current run's.
+
+    Returns:
+    - dict: Stage name to number of successes.
+    """
+    df = load_stage_metrics(start, end, list(stages), db_path=db_path)
+    counts = df[df['success']].groupby('stage').size()
+    return {stage: int(counts.get(stage, 0)) for stage in stages}
@@ -0,0 +1,274 @@
+import cProfile
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+import pandas as pd
+from logger_setup import log_stage_event, stage_events_enabled
+from metrics_store import current_run, rss_mb
+
+# Profiling settings; change them with configure_profiling
+profile_settings = {
+    # Track peak allocated memory per stage with tracemalloc
+    'trace_memory': True,
+    # Opt-in per-stage profile capture: None, 'cprofile' (.prof files for
+    # snakeviz or gprof2dot) or 'sampling' (.folded collapsed stacks)
+    'capture': None,
+    # Seconds between stack samples in 'sampling' mode
+    'sample_interval': 0.005,
+    # Directory the captured profiles are exported to
+    'output_dirpath': 'profiles',
+}
+
+# One entry per profiled stage execution, in completion order
+stage_profiles = []
+
+# Stages whose memory is being traced, on every thread. The tracemalloc
+# peak is process-wide, so it is only reset under _memory_lock, after being
+# folded into each of them
+_memory_entries = []
+_memory_lock = threading.Lock()
+# Only one stage at a time can be captured by cProfile or the sampler
+_capture_lock = threading.Lock()
+# Stage events belong to the metrics_store run when one is active, otherwise
+# to the run started by start_profile_run (or, before that, to this process)
+_profile_run = {'run_id': uuid.uuid4().hex}
+
+# Function to start a new run for the stage events of this process
+def start_profile_run():
+    """
+    Give the stage events logged from now on a new run ID, so that a
+    process running the pipeline several times (e.g. a scheduler worker)
+    logs each run under its own ID.
+
+    Returns:
+    - str: The new run ID.
+    """
+    _profile_run['run_id'] = uuid.uuid4().hex
+    return _profile_run['run_id']
+
+# Function to change the profiling settings
+def configure_profiling(**settings):
+    """
+    Update profile_settings, e.g. configure_profiling(capture='sampling').
+
+    Args:
+    - **settings: Keys of profile_settings and their new values.
+    """
+    unknown = set(settings) - set(profile_settings)
+    if unknown:
+        raise ValueError(f"Unknown profiling settings: {sorted(unknown)}")
+    profile_settings.update(settings)
+
+# Helper returning the row count of a stage input or output
+def _rows(value):
+    return len(value) if isinstance(value, pd.DataFrame) else None
+
+# Helper folding the tracemalloc peak so far into every traced stage
+def _fold_peak():
+    peak = tracemalloc.get_traced_memory()[1]
+    for entry in _memory_entries:
+        entry['_peak'] = max(entry['_peak'], peak)
+
+# Helper formatting a frame for a collapsed stack
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+# Helper sampling the stack of one thread until stopped
+def _sample_stacks(thread_id, stacks, stop, interval):
+    while not stop.wait(interval):
+        frame = sys._current_frames().get(thread_id)
+        labels = []
+        while frame is not None:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        if labels:
+            stacks[';'.join(reversed(labels))] += 1
+
+# Helper starting the opt-in profile capture of a stage
+def _start_capture(mode):
+    if mode is None or not _capture_lock.acquire(blocking=False):
+        return None
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) is already active
+            _capture_lock.release()
+            return None
+        return {'mode': mode, 'profiler': profiler}
+
+    stacks = Counter()
+    stop = threading.Event()
+    sampler = threading.Thread(target=_sample_stacks, daemon=True,
+                               args=(threading.get_ident(), stacks, stop, profile_settings['sample_interval']))
+    sampler.start()
+    return {'mode': mode, 'stacks': stacks, 'stop': stop, 'sampler': sampler}
+
+# Helper stopping a capture and exporting it
+def _finish_capture(capture, stage):
+    if capture is None:
+        return None
+    try:
+        os.makedirs(profile_settings['output_dirpath'], exist_ok=True)
+        basename = os.path.join(profile_settings['output_dirpath'], f"{stage}-{time.strftime('%Y%m%d-%H%M%S')}")
+        if capture['mode'] == 'cprofile':
+            capture['profiler'].disable()
+            filepath = basename + '.prof'
+            capture['profiler'].dump_stats(filepath)
+        else:
+            capture['stop'].set()
+            capture['sampler'].join()
+            filepath = basename + '.folded'
+            export_collapsed_stacks(capture['stacks'], filepath)
+        return filepath
+    except Exception as e:
+        print(f"Error exporting {stage} profile: {e}")
+        return None
+    finally:
+        _capture_lock.release()
+
+# Function to write sampled stacks for flame graph tools
+def export_collapsed_stacks(stacks, filepath):
+    """
+    Write stack samples in the collapsed format ('outer;inner count' per
+    line) read by flamegraph.pl, speedscope and inferno.
+
+    Args:
+    - stacks (Counter): Sample count per ';'-joined stack.
+    - filepath (str): Output file path.
+    """
+    with open(filepath, 'w') as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+
+# Context manager profiling one stage
+@contextmanager
+def stage_profile(stage, rows_in=None, log_event=True):
+    """
+    Profile the enclosed block as one pipeline stage.
+
+    Records monotonic wall time, process CPU time, peak memory allocated
+    while the stage ran (tracemalloc) and row counts, and, if capture is
+    enabled, a cProfile or sampled-stack profile of the stage. Stages may
+    be nested; a stage's peak memory includes its nested stages. Memory
+    allocated by other threads at the same time is counted too, and the
+    stages that ran on other threads meanwhile are listed in 'overlapped'.
+    Unless log_event is False, the stage is also logged as a structured
+    stage event (see logger_setup.log_stage_event).
+
+    Args:
+    - stage (str): Stage name.
+    - rows_in (int, optional): Rows given to the stage.
+    - log_event (bool): Log a stage event when the stage ends.
+
+    Yields:
+    - dict: The stage's profile entry; set 'rows_out' on it to record the
+      rows produced, and 'success' to False if the stage failed.
+    """
+    entry = {'stage': stage, 'wall_time': None, 'cpu_time': None, 'peak_memory_mb': None,
+             'rows_in': rows_in, 'rows_out': None, 'profile_path': None, 'overlapped': None,
+             'success': True}
+    trace_memory = profile_settings['trace_memory']
+    if trace_memory:
+        thread_id = threading.get_ident()
+        with _memory_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # Keep the peak of every running stage, including those on other
+            # threads, before resetting it for this one
+            _fold_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            entry.update({'_baseline': baseline, '_peak': baseline, '_thread': thread_id, 'overlapped': set()})
+            for other in _memory_entries:
+                if other['_thread'] != thread_id:
+                    other['overlapped'].add(stage)
+                    entry['overlapped'].add(other['stage'])
+            _memory_entries.append(entry)
+
+    capture = _start_capture(profile_settings['capture'])
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield entry
+    except BaseException:
+        entry['success'] = False
+        raise
+    finally:
+        entry['wall_time'] = time.perf_counter() - wall_start
+        entry['cpu_time'] = time.process_time() - cpu_start
+        entry['profile_path'] = _finish_capture(capture, stage)
+        if trace_memory:
+            with _memory_lock:
+                if tracemalloc.is_tracing():
+                    _fold_peak()
+                    entry['peak_memory_mb'] = (entry['_peak'] - entry['_baseline']) / 2**20
+                _memory_entries.remove(entry)
+            for key in ('_peak', '_baseline', '_thread'):
+                del entry[key]
+            entry['overlapped'] = sorted(entry['overlapped'])
+        stage_profiles.append(entry)
+        # Resident memory is read from the OS, so only when the event is logged
+        if log_event and stage_events_enabled():
+            log_stage_event(current_run['run_id'] or _profile_run['run_id'], stage, entry['wall_time'], entry['success'],
+                            rows_in, entry['rows_out'], rss_mb=round(rss_mb(), 1))
+
+# Decorator profiling every call of a stage function
+def profile_stage(stage=None, log_event=True):
+    """
+    Profile each call of the decorated function with stage_profile.
+
+    Rows in are taken from the first DataFrame argument and rows out from
+    a DataFrame return value. A stage returning None or False failed.
+
+    Args:
+    - stage (str, optional): Stage name. Defaults to the function name.
+    - log_event (bool): Log a stage event per call; turn off for stages
+      that already record themselves with metrics_store.record_stage.
+    """
+    def decorator(func):
+        name = stage or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows_in = next((_rows(arg) for arg in args if isinstance(arg, pd.DataFrame)), None)
+            with stage_profile(name, rows_in, log_event) as entry:
+                result = func(*args, **kwargs)
+                entry['rows_out'] = _rows(result)
+                entry['success'] = result is not None and result is not False
+                return result
+        return wrapper
+    return decorator
+
+# Function to tabulate the recorded stage profiles
+def profile_summary():
+    """
+    Return the recorded stage profiles.
+
+    Returns:
+    - DataFrame: One row per profiled stage execution.
+    """
+    return pd.DataFrame(stage_profiles, columns=['stage', 'wall_time', 'cpu_time', 'peak_memory_mb',
+                                                 'rows_in', 'rows_out', 'profile_path', 'overlapped'])
+
+# Function to print the recorded stage profiles
+def print_stage_profiles():
+    """
+    Print wall time, CPU time, peak memory and rows of each profiled stage.
+    """
+    for entry in stage_profiles:
+        memory = f"{entry['peak_memory_mb']:.1f} MB" if entry['peak_memory_mb'] is not None else "n/a"
+        line = (f"{entry['stage']}: wall {entry['wall_time']:.3f}s, cpu {entry['cpu_time']:.3f}s, "
+                f"peak memory {memory}, rows {entry['rows_in']} -> {entry['rows_out']}")
+        if entry['profile_path']:
+            line += f", profile {entry['profile_path']}"
+        if entry['overlapped']:
+            line += f", overlapped {', '.join(entry['overlapped'])}"
+        print(line)
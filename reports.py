@@ -2,24 +2,26 @@ import pandas as pd
 import os
 import time  # Importing time for tracking duration
 from logger_setup import logger  # Importing the configured logger
-import matplotlib.pyplot as plt 
-from datetime import datetime
-import time
-
-# Global variables for monitoring
-metrics = {
-    'load_time': [],
-    'clean_time': [],
-    'transform_time': [],
-    'dates': [],  # List to store the dates for tracking ETL run times
-    'load_success': 0,
-    'clean_success': 0,
-    'transform_success': 0
-}
+from background_save import start_background_save, finish_background_save
+from etl_automation import add_calendar_features, atomic_output
+from metrics_store import (start_run, record_stage, finish_run, file_size, load_stage_metrics,
+                           stage_duration_trends, stage_success_counts)
+from stage_cache import CACHE_DIRPATH, stage_key, code_fingerprint, outputs_current, record_outputs
+from concurrent.futures import ProcessPoolExecutor
+# Charts are drawn on Agg figures directly: no pyplot state, no GUI backend
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Chart images, and the most charts rendered at once in worker processes
+SUCCESS_RATES_PATH = 'reports/success_rates.png'
+TRENDS_PATH = 'reports/trends.png'
+RENDER_WORKERS = 2
+
 
 # Function to load data
 def load_data(filepath):
-    start_time = time.time()  # Start timing
+    start_time = time.perf_counter()  # Start timing
+    df = None
     try:
         directory = os.path.dirname(filepath)
         if directory:  # Only try to create directory if it exists in the path
@@ -36,7 +38,6 @@ def load_data(filepath):
         
         if df is not None:
             logger.info("Data loaded successfully.")
-            metrics['load_success'] += 1
         else:
             logger.warning("Warning: Loaded data is None.")
         return df
@@ -44,11 +45,14 @@ def load_data(filepath):
         logger.error(f"Error loading data: {e}")
         return None
     finally:
-        metrics['load_time'].append(time.time() - start_time)  # Log load time
+        record_stage('load', time.perf_counter() - start_time, success=df is not None,
+                     rows=None if df is None else len(df), bytes_read=file_size(filepath))
 
 # Function for cleaning the data
 def clean_data(df):
-    start_time = time.time()  # Start timing
+    start_time = time.perf_counter()  # Start timing
+    rows_in = len(df)
+    success = False
     try:
         # Handle missing values
         df.dropna(inplace=True)
@@ -68,11 +72,12 @@ def clean_data(df):
         df = df[(df['Quantity'] > 0) & (df['Price per Unit'] > 0)]
 
         logger.info("Data cleaned successfully.")
-        metrics['clean_success'] += 1
+        success = True
     except Exception as e:
         logger.error(f"Error cleaning data: {e}")
     finally:
-        metrics['clean_time'].append(time.time() - start_time)  # Log clean time
+        record_stage('clean', time.perf_counter() - start_time, success=success, rows=len(df),
+                     rows_in=rows_in)
         return df   
      
 # Function to validate cleaned data
@@ -108,46 +113,41 @@ def save_cleaned_data(df, cleaned_filepath):
     - df (DataFrame): The DataFrame to save.
     - cleaned_filepath (str): Path to save the cleaned data.
     """
+    start_time = time.perf_counter()
+    success = False
     try:
-        df.to_pickle(cleaned_filepath)
+        with atomic_output(cleaned_filepath) as temp_path:
+            df.to_pickle(temp_path)
         logger.info("Cleaned data saved successfully.")
+        success = True
     except Exception as e:
-        logger.error(f"Error saving cleaned data: {e}")    
+        logger.error(f"Error saving cleaned data: {e}")
+    finally:
+        record_stage('save_cleaned', time.perf_counter() - start_time, success=success,
+                     rows=len(df), rows_in=len(df), bytes_written=file_size(cleaned_filepath))
 
 # Function for transforming the data
 def transform_data(df):
-    start_time = time.time()  # Start timing
+    start_time = time.perf_counter()  # Start timing
+    success = False
     if df is None:
         logger.error("Error: DataFrame is None. Transformation skipped.")
         return None
     try:
         # (Transformation code as before)
-        # Create a Day of Week column
-        df['Day of Week'] = df['Date'].dt.day_name()
-        # Example transformation: Add a 'Season' column based on 'Date'
-        df['Month'] = df['Date'].dt.month
-
-        def get_season(month):
-            if month in [12, 1, 2]:
-                return 'Winter'
-            elif month in [3, 4, 5]:
-                return 'Spring'
-            elif month in [6, 7, 8]:
-                return 'Summer'
-            else:
-                return 'Fall'
-
-        df['Season'] = df['Month'].apply(get_season)
+        # Add 'Day of Week', 'Month' and 'Season' columns based on 'Date'
+        add_calendar_features(df)
 
         # Add a derived column, Revenue
         df['Revenue'] = df['Quantity'] * df['Price per Unit']        
 
         logger.info("Data transformed successfully.")
-        metrics['transform_success'] += 1
+        success = True
     except Exception as e:
         logger.error(f"Error transforming data: {e}")
     finally:
-        metrics['transform_time'].append(time.time() - start_time)  # Log transform time
+        record_stage('transform', time.perf_counter() - start_time, success=success, rows=len(df),
+                     rows_in=len(df))
         return df
 
 # Function to validate transformed data
@@ -184,114 +184,189 @@ def save_transformed_data(df, transformed_filepath):
     - df (DataFrame): The DataFrame to save.
     - transformed_filepath (str): Path to save the transformed data.
     """
+    start_time = time.perf_counter()
+    success = False
     try:
-        df.to_pickle(transformed_filepath)
+        with atomic_output(transformed_filepath) as temp_path:
+            df.to_pickle(temp_path)
         logger.info("Transformed data saved successfully.")
+        success = True
     except Exception as e:
         logger.error(f"Error saving transformed data: {e}")
+    finally:
+        record_stage('save_transformed', time.perf_counter() - start_time, success=success,
+                     rows=len(df), rows_in=len(df), bytes_written=file_size(transformed_filepath))
 
 
 # Function to print monitoring results
-def print_monitoring_results():
+def print_monitoring_results(run_id):
     logger.info("Monitoring Results:")
-    logger.info(f"Load Times: {metrics['load_time']}")
-    logger.info(f"Clean Times: {metrics['clean_time']}")
-    logger.info(f"Transform Times: {metrics['transform_time']}")
-    logger.info(f"Load Successes: {metrics['load_success']}")
-    logger.info(f"Clean Successes: {metrics['clean_success']}")
-    logger.info(f"Transform Successes: {metrics['transform_success']}")
+    for stage in load_stage_metrics(run_id=run_id).itertuples():
+        status = "succeeded" if stage.success else "failed"
+        logger.info(f"{stage.stage}: {status} in {stage.duration:.3f}s, rows={stage.rows}, "
+                    f"bytes read={stage.bytes_read}, bytes written={stage.bytes_written}, "
+                    f"peak memory={stage.peak_memory_mb:.1f} MB")
+
+
+# Helper creating a figure drawn with the non-interactive Agg canvas
+def _new_figure():
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    return figure
+
+# Helper writing a figure to its image path
+def _save_figure(figure, chart_path):
+    directory = os.path.dirname(chart_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with atomic_output(chart_path) as temp_path:
+        figure.savefig(temp_path, format='png')
+
+# Functions to render the charts; they run in worker processes
+def render_success_rates(success_counts, chart_path=SUCCESS_RATES_PATH):
+    categories = ['Load Success', 'Clean Success', 'Transform Success']
+    success_counts = [success_counts['load'], success_counts['clean'], success_counts['transform']]
+
+    figure = _new_figure()
+    ax = figure.add_subplot()
+    ax.bar(categories, success_counts, color=['blue', 'orange', 'green'])
+    ax.set_title('Success Rates of ETL Pipeline')
+    ax.set_ylabel('Number of Successful Processes')
+    _save_figure(figure, chart_path)
+    return chart_path
+
+def render_trends(trends, chart_path=TRENDS_PATH):
+    # One point per recorded run, from the persistent metrics store
+    figure = _new_figure()
+    ax = figure.add_subplot()
+    ax.plot(trends.index, trends['load'], label='Load Time', marker='o')
+    ax.plot(trends.index, trends['clean'], label='Clean Time', marker='o')
+    ax.plot(trends.index, trends['transform'], label='Transform Time', marker='o')
+
+    ax.set_title('ETL Process Time Trends')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Time (seconds)')
+    ax.legend()
+    _save_figure(figure, chart_path)
+    return chart_path
+
+# Helper deriving the cache key of a chart from its data and drawing code
+def _chart_key(render_func, data):
+    if isinstance(data, pd.DataFrame):
+        data = data.to_csv()
+    return stage_key(render_func.__name__, data, code_fingerprint(render_func))
+
+# Function to render the report charts
+def render_charts(charts, workers=RENDER_WORKERS, cache_dirpath=CACHE_DIRPATH):
+    """
+    Render charts headlessly, skipping those whose image was already drawn
+    from the same data with the same code. The others are drawn in parallel
+    worker processes (in this process if only one needs drawing).
 
+    Args:
+    - charts (list): (render function, data, image path) of each chart.
+    - workers (int): Most worker processes to draw with.
+    - cache_dirpath (str): Directory recording the key each image was drawn from.
 
-# Functions to Plot visualizations
-def plot_success_rates(metrics):
-    categories = ['Load Success', 'Clean Success', 'Transform Success']
-    success_counts = [metrics['load_success'], metrics['clean_success'], metrics['transform_success']]
-    
-    plt.bar(categories, success_counts, color=['blue', 'orange', 'green'])
-    plt.title('Success Rates of ETL Pipeline')
-    plt.ylabel('Number of Successful Processes')
-    
-    success_rates_path = 'reports/success_rates.png'
-    # Create the 'reports' directory if it doesn't exist
-    os.makedirs(os.path.dirname(success_rates_path), exist_ok=True)
-
-    plt.savefig(success_rates_path) # Save the plot
-    plt.show()  # Debugging: Verify plot display
-    plt.close() # Close the plot to free memory
-    return success_rates_path
-
-def plot_trends(metrics):
-    plt.plot(metrics['dates'], metrics['load_time'], label='Load Time', marker='o')
-    plt.plot(metrics['dates'], metrics['clean_time'], label='Clean Time', marker='o')
-    plt.plot(metrics['dates'], metrics['transform_time'], label='Transform Time', marker='o')
-
-    plt.title('ETL Process Time Trends')
-    plt.xlabel('Date')
-    plt.ylabel('Time (seconds)')
-    plt.legend()
-
-    trends_path = 'reports/trends.png'
-    plt.savefig(trends_path)
-    plt.show()  # Debugging: Verify plot display
-    plt.close()
-    return trends_path
+    Returns:
+    - list: The image path of each chart, or None where drawing failed.
+    """
+    paths = [None] * len(charts)
+    pending = []
+    for i, (render_func, data, chart_path) in enumerate(charts):
+        key = _chart_key(render_func, data)
+        if outputs_current(cache_dirpath, key, [chart_path]):
+            logger.info(f"{chart_path} is up to date, not redrawn.")
+            paths[i] = chart_path
+        else:
+            pending.append((i, key))
+
+    def finish(i, key, render):
+        chart_path = charts[i][2]
+        try:
+            paths[i] = render()
+            record_outputs(cache_dirpath, key, [chart_path])
+        except Exception as e:
+            logger.error(f"Error rendering {chart_path}: {e}")
+
+    if len(pending) == 1 or workers <= 1:
+        for i, key in pending:
+            render_func, data, chart_path = charts[i]
+            finish(i, key, lambda: render_func(data, chart_path))
+    elif pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+            futures = [(i, key, executor.submit(*charts[i])) for i, key in pending]
+            for i, key, future in futures:
+                finish(i, key, future.result)
+    return paths
+
+# Functions to plot visualizations
+def plot_success_rates(success_counts):
+    return render_charts([(render_success_rates, success_counts, SUCCESS_RATES_PATH)])[0]
+
+def plot_trends(trends):
+    # Check if any runs have been recorded
+    if trends.empty:
+        logger.error("No runs recorded in the metrics store, cannot plot trends.")
+        return None
+    return render_charts([(render_trends, trends, TRENDS_PATH)])[0]
 
 # Generating HMTL report
 def generate_report(report_filepath, success_rates_path, trends_path):
-    os.makedirs(os.path.dirname(report_filepath), exist_ok=True)
+    directory = os.path.dirname(report_filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
     with open(report_filepath, 'w') as f:
         f.write("<html><body><h1>Automated ETL Pipeline Report</h1>\n")
         f.write("<h2>Success Rates:</h2>\n")
         f.write(f"<img src='{success_rates_path}' alt='Success Rates'>\n")
         f.write("<h2>Trends Over Time:</h2>\n")
-        f.write(f"<img src='{trends_path}' alt='Trends'>\n")
+        if trends_path is not None:
+            f.write(f"<img src='{trends_path}' alt='Trends'>\n")
         f.write("</body></html>")
 
 
 
-def main(input_filepath, cleaned_filepath, transformed_filepath, report_filepath):
+def main(input_filepath, cleaned_filepath, transformed_filepath, report_filepath, persist_cleaned=True):
+    # Each stage records its own metrics against this run
+    run_id = start_run('reports')
+    status = 'failed'
+
     # Load the initial data
-    start_time = time.time()  # Start timer for loading
     df = load_data(input_filepath)
     if df is not None:
-        load_time = time.time() - start_time  # Calculate load time
-        metrics['load_time'].append(load_time)  # Append load time
-        metrics['dates'].append(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))  # Capture load date
-
         # Clean the data
-        start_time = time.time()  # Start timer for cleaning
         cleaned_df = clean_data(df)
         
         # Validate cleaned data
         if validate_cleaned_data(cleaned_df):
-            # Save cleaned data
-            save_cleaned_data(cleaned_df, cleaned_filepath)
-            clean_time = time.time() - start_time  # Calculate clean time
-            metrics['clean_time'].append(clean_time)  # Append clean time
-            metrics['dates'].append(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))  # Capture clean date
+            # Save cleaned data in the background while transforming
+            save_handle = None
+            if persist_cleaned:
+                save_handle = start_background_save(save_cleaned_data, cleaned_df, cleaned_filepath)
+            
+            # Transform a copy so the background save sees the cleaned frame unchanged
+            transformed_df = transform_data(cleaned_df.copy(deep=False))
             
-            # Load cleaned data for transformation
-            cleaned_df = load_data(cleaned_filepath)
-            if cleaned_df is not None:
-                # Transform the data
-                start_time = time.time()  # Start timer for transformation
-                transformed_df = transform_data(cleaned_df)
-                
-                # Validate transformed data
-                if validate_transformed_data(transformed_df):
-                    # Save the transformed data
-                    save_transformed_data(transformed_df, transformed_filepath)
-                    transform_time = time.time() - start_time  # Calculate transform time
-                    metrics['transform_time'].append(transform_time)  # Append transform time
-                    metrics['dates'].append(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))  # Capture transform date
+            # Validate transformed data
+            if validate_transformed_data(transformed_df):
+                # Save the transformed data
+                save_transformed_data(transformed_df, transformed_filepath)
+                status = 'success'
 
-    # Print monitoring results
-    print_monitoring_results()
+            finish_background_save(save_handle)
+    finish_run(status)
 
-    # Plot and generate report
-    success_rates_path = plot_success_rates(metrics)
-    trends_path = plot_trends(metrics)
-    generate_report(report_filepath, success_rates_path, trends_path)
+    # Print monitoring results
+    print_monitoring_results(run_id)
+
+    # Plot both charts at once and generate the report
+    charts = [(render_success_rates, stage_success_counts(), SUCCESS_RATES_PATH)]
+    trends = stage_duration_trends()
+    if not trends.empty:
+        charts.append((render_trends, trends, TRENDS_PATH))
+    success_rates_path, *trends_path = render_charts(charts)
+    generate_report(report_filepath, success_rates_path, trends_path[0] if trends_path else None)
     logger.info("ETL process and report generation completed.")
 
 
@@ -301,6 +376,8 @@ if __name__ == "__main__":
     cleaned_filepath = 'cleaned_data.pkl'
     transformed_filepath = 'transform_data.pkl'
     report_filepath = 'etl_report.html'
+    # Set to False to skip writing the intermediate cleaned data
+    persist_cleaned = True
     
     # Run the data pipeline
-    main(input_filepath, cleaned_filepath, transformed_filepath, report_filepath)
+    main(input_filepath, cleaned_filepath, transformed_filepath, report_filepath, persist_cleaned)
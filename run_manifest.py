@@ -0,0 +1,110 @@
+import json
+import os
+import pandas as pd
+from stage_cache import fingerprint_file
+
+# Records the stages the last pipeline run completed, so a failed run can be
+# resumed from its last good stage instead of from the raw input
+MANIFEST_PATH = 'etl_manifest.json'
+
+# Helper writing the manifest through a temporary file
+def _save_manifest(manifest):
+    manifest_path = manifest['manifest_path']
+    directory = os.path.dirname(manifest_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+# Function to open the manifest of a pipeline run
+def start_manifest(manifest_path, run_key):
+    """
+    Start recording a pipeline run. If the previous run had the same key
+    (same input, code and configuration) and did not complete, its
+    completed stages are kept so this run can resume after them.
+
+    Args:
+    - manifest_path (str): Manifest file path.
+    - run_key (str): Key identifying the input, code and configuration.
+
+    Returns:
+    - dict: The manifest, to pass to the other manifest functions.
+    """
+    try:
+        with open(manifest_path) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+
+    stages = {}
+    if previous.get('run_key') == run_key and previous.get('status') != 'completed':
+        stages = previous.get('stages', {})
+        if stages:
+            print(f"Resuming the previous run after: {', '.join(stages)}.")
+
+    manifest = {'manifest_path': manifest_path, 'run_key': run_key, 'status': 'running',
+                'started_at': pd.Timestamp.now().isoformat(timespec='seconds'), 'stages': stages}
+    try:
+        _save_manifest(manifest)
+    except Exception as e:
+        print(f"Error writing the run manifest: {e}")
+    return manifest
+
+# Function to check whether a stage can be skipped
+def stage_completed(manifest, stage):
+    """
+    Check whether a stage completed in this run or the run being resumed,
+    and that the outputs it wrote are still exactly as it left them.
+
+    Args:
+    - manifest (dict or None): Manifest from start_manifest.
+    - stage (str): Stage name.
+
+    Returns:
+    - bool: True if the stage does not need to run again.
+    """
+    if manifest is None or stage not in manifest['stages']:
+        return False
+    outputs = manifest['stages'][stage]['outputs']
+    return all(os.path.exists(path) and fingerprint_file(path) == fingerprint
+               for path, fingerprint in outputs.items())
+
+# Function to record a completed stage
+def mark_stage_completed(manifest, stage, output_paths=()):
+    """
+    Record that a stage completed and fingerprint the outputs it wrote.
+
+    Args:
+    - manifest (dict or None): Manifest from start_manifest; nothing is
+      recorded when None.
+    - stage (str): Stage name.
+    - output_paths (sequence): Files or directories the stage wrote.
+    """
+    if manifest is None:
+        return
+    try:
+        manifest['stages'][stage] = {
+            'completed_at': pd.Timestamp.now().isoformat(timespec='seconds'),
+            'outputs': {path: fingerprint_file(path) for path in output_paths},
+        }
+        _save_manifest(manifest)
+    except Exception as e:
+        print(f"Error recording the {stage} stage in the run manifest: {e}")
+
+# Function to record the end of a pipeline run
+def finish_manifest(manifest):
+    """
+    Mark the run as completed, so the next run starts from the raw input.
+
+    Args:
+    - manifest (dict or None): Manifest from start_manifest.
+    """
+    if manifest is None:
+        return
+    try:
+        manifest['status'] = 'completed'
+        manifest['finished_at'] = pd.Timestamp.now().isoformat(timespec='seconds')
+        _save_manifest(manifest)
+    except Exception as e:
+        print(f"Error completing the run manifest: {e}")
@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from logger_setup import logger, stop_logging
+
+# File locks are taken with fcntl on POSIX and msvcrt on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Pipeline run by the scheduler. Paths may contain strftime fields, which
+# are filled in with the time of the scheduled run, e.g.
+# 'data/sales_%Y-%m-%d.csv' for daily extracts.
+PIPELINE_JOB = {
+    'input_filepath': 'data/retail_sales_dataset.csv',
+    'cleaned_filepath': 'cleaned_data.pkl',
+    'transformed_filepath': 'transform_data.pkl',
+    'persist_cleaned': True,
+}
+
+# Records the last scheduled run, so missed runs can be backfilled
+SCHEDULER_STATE_PATH = 'scheduler_state.json'
+
+# Runs executed at the same time (backfill included), and the most missed
+# runs that are backfilled after downtime
+DEFAULT_CONCURRENCY = 2
+MAX_BACKFILL_RUNS = 24
+
+# Ranges of the five cron fields: minute, hour, day of month, month, day of
+# week (0 and 7 are both Sunday)
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+# Interval runs are aligned to this time, so run times do not depend on
+# when the scheduler was started
+INTERVAL_EPOCH = datetime(2000, 1, 1)
+
+# Interval suffixes accepted by parse_schedule, e.g. '15m' or '1d'
+INTERVAL_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+
+# Context manager holding an exclusive lock on a file
+@contextmanager
+def pipeline_lock(lock_path):
+    """
+    Take an exclusive, non-blocking lock on lock_path. The operating system
+    releases the lock if the process dies, so a crashed run never leaves a
+    stale lock behind.
+
+    Args:
+    - lock_path (str): Lock file path.
+
+    Yields:
+    - bool: True if the lock was acquired, False if another run holds it.
+    """
+    directory = os.path.dirname(lock_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(lock_path, 'a+') as lock_file:
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+# Function to return the lock file guarding a pipeline's outputs
+def output_lock_path(cleaned_filepath):
+    return cleaned_filepath + '.lock'
+
+# Helper parsing one cron field into the set of values it matches
+def _parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        value_range, _, step = part.partition('/')
+        if value_range == '*':
+            start, end = low, high
+        elif '-' in value_range:
+            start, end = (int(value) for value in value_range.split('-'))
+        else:
+            start = int(value_range)
+            end = high if step else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field out of range: {field}")
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return values
+
+# Function to parse a schedule
+def parse_schedule(schedule):
+    """
+    Parse an interval or a cron expression.
+
+    Args:
+    - schedule (int, float, timedelta or str): Seconds between runs, a
+      timedelta, an interval string like '30s', '15m', '1h' or '1d', or a
+      five-field cron expression like '0 2 * * *' (day of week 0 is Sunday).
+
+    Returns:
+    - dict: {'interval': timedelta}, or {'cron': list of the five fields'
+      value sets, 'restricted_days': bool}.
+    """
+    if isinstance(schedule, timedelta):
+        return {'interval': schedule}
+    if isinstance(schedule, (int, float)):
+        return {'interval': timedelta(seconds=schedule)}
+
+    fields = schedule.split()
+    if len(fields) == 5:
+        cron = [_parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)]
+        if 7 in cron[4]:
+            cron[4] = (cron[4] - {7}) | {0}
+        # When both day fields are restricted, a day matching either one runs
+        return {'cron': cron, 'restricted_days': fields[2] != '*' and fields[4] != '*'}
+    if len(fields) == 1 and schedule[-1] in INTERVAL_UNITS:
+        return {'interval': timedelta(**{INTERVAL_UNITS[schedule[-1]]: float(schedule[:-1])})}
+    raise ValueError(f"Unsupported schedule: {schedule}")
+
+# Helper checking whether a day matches a cron schedule
+def _cron_day_matches(schedule, day):
+    _, _, days_of_month, months, days_of_week = schedule['cron']
+    if day.month not in months:
+        return False
+    day_of_month = day.day in days_of_month
+    # Python counts Monday as 0, cron counts Sunday as 0
+    day_of_week = (day.weekday() + 1) % 7 in days_of_week
+    if schedule['restricted_days']:
+        return day_of_month or day_of_week
+    return day_of_month and day_of_week
+
+# Function to find the next scheduled run
+def next_run_time(schedule, after):
+    """
+    Return the first scheduled run strictly after a given time.
+
+    Args:
+    - schedule (dict): Output of parse_schedule.
+    - after (datetime): Reference time.
+
+    Returns:
+    - datetime: The next run time.
+    """
+    if 'interval' in schedule:
+        interval = schedule['interval']
+        return INTERVAL_EPOCH + ((after - INTERVAL_EPOCH) // interval + 1) * interval
+
+    minutes, hours = sorted(schedule['cron'][0]), sorted(schedule['cron'][1])
+    day = after.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Every valid cron expression matches within a few years
+    for _ in range(366 * 5):
+        if _cron_day_matches(schedule, day):
+            for hour in hours:
+                for minute in minutes:
+                    candidate = day.replace(hour=hour, minute=minute)
+                    if candidate > after:
+                        return candidate
+        day += timedelta(days=1)
+    raise ValueError("Cron schedule never runs")
+
+# Function to list the runs missed between two times
+def missed_runs(schedule, last_run, now, limit=MAX_BACKFILL_RUNS):
+    """
+    List the scheduled runs after last_run up to and including now.
+
+    Args:
+    - schedule (dict): Output of parse_schedule.
+    - last_run (datetime): The last run that was started.
+    - now (datetime): Current time.
+    - limit (int): Only return the most recent runs.
+
+    Returns:
+    - list: Missed run times, oldest first.
+    """
+    if 'interval' in schedule:
+        # Skip straight to the runs that can be returned
+        last_run = max(last_run, now - (limit + 1) * schedule['interval'])
+    runs = []
+    run_time = next_run_time(schedule, last_run)
+    while run_time <= now:
+        runs.append(run_time)
+        if len(runs) > limit:
+            runs.pop(0)
+        run_time = next_run_time(schedule, run_time)
+    return runs
+
+# Function to fill in the paths of a job for a run time
+def job_for_run(job, run_time):
+    return {key: run_time.strftime(value) if isinstance(value, str) else value for key, value in job.items()}
+
+# Function to run the pipeline once, in a worker process
+def run_pipeline_job(job):
+    """
+    Run the automated pipeline under the lock of its outputs. If another run
+    (e.g. a cron-started automate.py) is writing the same outputs, this run
+    is skipped rather than clobbering them.
+
+    Args:
+    - job (dict): Pipeline paths and options, as in PIPELINE_JOB.
+
+    Returns:
+    - str: 'succeeded', 'failed' or 'skipped'.
+    """
+    # Imported here: automate imports pipeline_lock from this module
+    from automate import main
+    with pipeline_lock(output_lock_path(job['cleaned_filepath'])) as acquired:
+        if not acquired:
+            logger.warning(f"Another run is writing {job['cleaned_filepath']}, skipping.")
+            return 'skipped'
+        try:
+            succeeded = main(job['input_filepath'], job['cleaned_filepath'], job['transformed_filepath'],
+                             job['persist_cleaned'])
+        finally:
+            # Worker processes exit without running atexit, so write out
+            # this run's queued log records now
+            stop_logging()
+        return 'succeeded' if succeeded else 'failed'
+
+# Helper loading the scheduler state
+def _load_state(state_path):
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+        return {'last_run': datetime.fromisoformat(state['last_run'])}
+    except (OSError, ValueError, KeyError):
+        return {'last_run': None}
+
+# Helper saving the scheduler state
+def _save_state(state_path, last_run):
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump({'last_run': last_run.isoformat()}, f)
+    os.replace(state_path + '.tmp', state_path)
+
+# Helper answering health checks with the scheduler status as JSON
+async def _handle_health_check(reader, writer, status):
+    try:
+        await reader.readline()
+        body = json.dumps(status, default=str)
+        writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n{body}").encode())
+        await writer.drain()
+    finally:
+        writer.close()
+
+# Scheduler loop
+async def run_scheduler(schedule, job=PIPELINE_JOB, state_path=SCHEDULER_STATE_PATH, backfill=True,
+                        concurrency=DEFAULT_CONCURRENCY, max_backfill=MAX_BACKFILL_RUNS, health_port=None,
+                        stop_event=None):
+    """
+    Run the pipeline on a schedule until stop_event is set.
+
+    Pipeline runs execute in a process pool, so the event loop stays free to
+    answer health checks while pandas works. A run is skipped when a run
+    writing the same outputs is still going, whether it was started by this
+    scheduler or by another process. After downtime, the runs missed since
+    the last recorded run are backfilled in parallel, at most concurrency
+    at a time. Missed runs that would write the same outputs are collapsed
+    into the most recent one.
+
+    Args:
+    - schedule (int, float, timedelta or str): See parse_schedule.
+    - job (dict): Pipeline paths and options, as in PIPELINE_JOB.
+    - state_path (str): File recording the last scheduled run.
+    - backfill (bool): Run the runs missed while the scheduler was down.
+    - concurrency (int): Most runs executing at the same time.
+    - max_backfill (int): Most missed runs to backfill.
+    - health_port (int, optional): Serve the scheduler status over HTTP on
+      this port.
+    - stop_event (asyncio.Event, optional): Set to stop the scheduler.
+    """
+    schedule = parse_schedule(schedule)
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    status = {'started_at': datetime.now().isoformat(timespec='seconds'), 'running': [],
+              'next_run': None, 'last_run': None, 'runs': {'succeeded': 0, 'failed': 0, 'skipped': 0}}
+    state = _load_state(state_path)
+    # Locks of the runs in progress, to skip overlapping runs without a process
+    in_progress = set()
+    tasks = set()
+    executor = ProcessPoolExecutor(max_workers=concurrency)
+
+    async def run(run_time):
+        run_job = job_for_run(job, run_time)
+        lock_path = output_lock_path(run_job['cleaned_filepath'])
+        if lock_path in in_progress:
+            logger.warning(f"Run for {run_time} skipped, the previous run is still writing {run_job['cleaned_filepath']}.")
+            status['runs']['skipped'] += 1
+            return
+        in_progress.add(lock_path)
+        try:
+            async with semaphore:
+                status['running'].append(run_time.isoformat())
+                logger.info(f"Starting scheduled run for {run_time}.")
+                try:
+                    result = await loop.run_in_executor(executor, run_pipeline_job, run_job)
+                except Exception as e:
+                    logger.error(f"Scheduled run for {run_time} raised: {e}")
+                    result = 'failed'
+                status['running'].remove(run_time.isoformat())
+            status['runs'][result] += 1
+            status['last_run'] = {'run_time': run_time.isoformat(), 'result': result}
+            logger.info(f"Scheduled run for {run_time} {result}.")
+        finally:
+            in_progress.discard(lock_path)
+
+    def start(run_time):
+        task = asyncio.create_task(run(run_time))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        # Record the run as started, so a restart does not backfill it again
+        if state['last_run'] is None or run_time > state['last_run']:
+            state['last_run'] = run_time
+            _save_state(state_path, run_time)
+
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    server = None
+    if health_port is not None:
+        server = await asyncio.start_server(lambda reader, writer: _handle_health_check(reader, writer, status),
+                                            port=health_port)
+        logger.info(f"Scheduler health checks served on port {health_port}.")
+
+    try:
+        if backfill and state['last_run'] is not None:
+            runs = missed_runs(schedule, state['last_run'], datetime.now(), max_backfill)
+            # Only the latest of several runs writing the same outputs matters
+            latest = {output_lock_path(job_for_run(job, run_time)['cleaned_filepath']): run_time for run_time in runs}
+            if runs:
+                logger.info(f"Backfilling {len(latest)} of {len(runs)} missed runs.")
+            for run_time in sorted(latest.values()):
+                start(run_time)
+
+        while not stop_event.is_set():
+            run_time = next_run_time(schedule, datetime.now())
+            status['next_run'] = run_time.isoformat()
+            delay = (run_time - datetime.now()).total_seconds()
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=max(delay, 0))
+            except asyncio.TimeoutError:
+                start(run_time)
+
+        logger.info("Scheduler stopping, waiting for running pipelines to finish.")
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+        executor.shutdown(wait=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the ETL pipeline on a schedule.")
+    parser.add_argument('schedule', help="Interval such as '15m', '1h' or '1d', or a cron expression such as '0 2 * * *'")
+    parser.add_argument('--no-backfill', action='store_true', help="Do not run the runs missed while stopped")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--max-backfill', type=int, default=MAX_BACKFILL_RUNS)
+    parser.add_argument('--health-port', type=int, default=None)
+    args = parser.parse_args()
+
+    asyncio.run(run_scheduler(args.schedule, backfill=not args.no_backfill, concurrency=args.concurrency,
+                              max_backfill=args.max_backfill, health_port=args.health_port))
@@ -0,0 +1,256 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import pandas as pd
+
+# Directory holding cached stage outputs, and its size limit; the least
+# recently used entries are evicted past the limit
+CACHE_DIRPATH = '.etl_cache'
+MAX_CACHE_BYTES = 2 * 2**30
+
+# Records which stage key last produced each pipeline output, and the
+# fingerprint the output had then
+OUTPUTS_FILENAME = 'outputs.json'
+CACHE_EXTENSION = '.pkl'
+
+# Function to fingerprint an input file
+def fingerprint_file(filepath):
+    """
+    Fingerprint a file (or every file under a directory) from its path, size
+    and modification time, which is cheap enough to check on every run.
+
+    Args:
+    - filepath (str): File or directory path.
+
+    Returns:
+    - str: Hex digest identifying the file's current contents.
+    """
+    digest = hashlib.sha256()
+    filepaths = [filepath]
+    if os.path.isdir(filepath):
+        filepaths = sorted(os.path.join(root, name) for root, _, names in os.walk(filepath) for name in names)
+    elif os.path.exists(filepath + '-wal'):
+        # Writes to an SQLite database in WAL mode may only be in its log so far
+        filepaths.append(filepath + '-wal')
+    for path in filepaths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+# Helper listing the global names read by a code object and the code nested in it
+def _global_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _global_names(const)
+    return names
+
+# Helper serializing a module constant for fingerprinting
+def _constant_bytes(value):
+    try:
+        return pickle.dumps(value, protocol=4)
+    except Exception:
+        return repr(value).encode()
+
+# Function to fingerprint the code of a stage
+def code_fingerprint(func):
+    """
+    Fingerprint a stage function's source together with what it uses from
+    its module: the module-level constants it reads (lookup tables, schemas,
+    formats) and, recursively, the functions of the same module it calls.
+    Editing any of them invalidates the stage's cached outputs.
+
+    Args:
+    - func (callable): The stage function.
+
+    Returns:
+    - str: Hex digest of the function's code.
+    """
+    digest = hashlib.sha256()
+    pending = [func]
+    seen = set()
+    while pending:
+        func = inspect.unwrap(pending.pop())
+        if func in seen:
+            continue
+        seen.add(func)
+        try:
+            digest.update(inspect.getsource(func).encode())
+        except (OSError, TypeError):
+            digest.update(func.__code__.co_code)
+        for name in sorted(_global_names(func.__code__)):
+            value = func.__globals__.get(name)
+            if inspect.isfunction(value):
+                if value.__module__ == func.__module__:
+                    pending.append(value)
+            elif value is not None and not callable(value) and not inspect.ismodule(value):
+                digest.update(name.encode() + _constant_bytes(value))
+    return digest.hexdigest()
+
+# Function to derive the cache key of a stage
+def stage_key(stage, *parts):
+    """
+    Combine a stage name with everything its output depends on: the key or
+    fingerprint of its input, its code fingerprint and its configuration.
+
+    Args:
+    - stage (str): Stage name, e.g. 'load', 'clean', 'transform'.
+    - *parts: Values the stage output depends on; their repr is hashed.
+
+    Returns:
+    - str: '<stage>-<hex digest>'.
+    """
+    digest = hashlib.sha256(repr((stage,) + parts).encode()).hexdigest()
+    return f"{stage}-{digest[:32]}"
+
+# Helper returning the path of a cache entry
+def _entry_path(cache_dirpath, key):
+    return os.path.join(cache_dirpath, key + CACHE_EXTENSION)
+
+# Function to load a cached stage output
+def load_cached(cache_dirpath, key):
+    """
+    Load the cached output of a stage.
+
+    Args:
+    - cache_dirpath (str): Cache directory.
+    - key (str): Stage key from stage_key.
+
+    Returns:
+    - DataFrame: The cached output, or None on a cache miss.
+    """
+    entry_path = _entry_path(cache_dirpath, key)
+    if not os.path.exists(entry_path):
+        return None
+    try:
+        df = pd.read_pickle(entry_path)
+        # Mark the entry as recently used for eviction
+        os.utime(entry_path)
+        print(f"Reusing cached {key.split('-')[0]} output.")
+        return df
+    except Exception as e:
+        print(f"Error loading cached {key}, recomputing: {e}")
+        return None
+
+# Function to cache a stage output
+def store_cached(cache_dirpath, key, df, max_bytes=MAX_CACHE_BYTES):
+    """
+    Cache the output of a stage, then evict the least recently used entries
+    beyond max_bytes. Entries are written to a temporary file and renamed,
+    so a crash never leaves a partial entry behind.
+
+    Args:
+    - cache_dirpath (str): Cache directory.
+    - key (str): Stage key from stage_key.
+    - df (DataFrame): The stage output.
+    - max_bytes (int): Size limit of the cache directory.
+    """
+    try:
+        os.makedirs(cache_dirpath, exist_ok=True)
+        entry_path = _entry_path(cache_dirpath, key)
+        temp_path = entry_path + '.tmp'
+        df.to_pickle(temp_path)
+        os.replace(temp_path, entry_path)
+        evict(cache_dirpath, max_bytes)
+    except Exception as e:
+        print(f"Error caching {key}: {e}")
+
+# Function to bound the size of the cache
+def evict(cache_dirpath, max_bytes=MAX_CACHE_BYTES):
+    """
+    Remove the least recently used entries until the cache fits max_bytes.
+
+    Args:
+    - cache_dirpath (str): Cache directory.
+    - max_bytes (int): Size limit of the cache directory.
+    """
+    entries = []
+    for name in os.listdir(cache_dirpath):
+        if name.endswith(CACHE_EXTENSION):
+            stat = os.stat(os.path.join(cache_dirpath, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(os.path.join(cache_dirpath, name))
+        total -= size
+
+# Function to explicitly invalidate cached outputs
+def invalidate(cache_dirpath=CACHE_DIRPATH, stage=None):
+    """
+    Drop cached outputs, forcing the next run to recompute them.
+
+    Args:
+    - cache_dirpath (str): Cache directory.
+    - stage (str, optional): Only drop this stage's entries. By default the
+      whole cache is removed.
+    """
+    if not os.path.isdir(cache_dirpath):
+        return
+    if stage is None:
+        shutil.rmtree(cache_dirpath)
+        return
+    for name in os.listdir(cache_dirpath):
+        if name.startswith(stage + '-'):
+            os.remove(os.path.join(cache_dirpath, name))
+    # Outputs produced from the dropped entries can no longer be vouched for
+    outputs_path = os.path.join(cache_dirpath, OUTPUTS_FILENAME)
+    if os.path.exists(outputs_path):
+        os.remove(outputs_path)
+
+# Helper loading the output records
+def _load_outputs(cache_dirpath):
+    try:
+        with open(os.path.join(cache_dirpath, OUTPUTS_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Function to check whether outputs were produced from a given key
+def outputs_current(cache_dirpath, key, output_paths):
+    """
+    Check that every output exists, was last written from key and has not
+    been changed since, e.g. by an incremental run merging into it.
+
+    Args:
+    - cache_dirpath (str): Cache directory.
+    - key (str): Key of the stage that produces the outputs.
+    - output_paths (list): Output files or directories.
+
+    Returns:
+    - bool: True if none of the outputs needs rewriting.
+    """
+    outputs = _load_outputs(cache_dirpath)
+    for path in output_paths:
+        record = outputs.get(os.path.abspath(path))
+        if not (os.path.exists(path) and isinstance(record, dict) and record['key'] == key
+                and record['fingerprint'] == fingerprint_file(path)):
+            return False
+    return True
+
+# Function to record the key outputs were produced from
+def record_outputs(cache_dirpath, key, output_paths):
+    """
+    Record that the outputs were written from key, with their fingerprints
+    (see fingerprint_file).
+
+    Args:
+    - cache_dirpath (str): Cache directory.
+    - key (str): Key of the stage that produced the outputs.
+    - output_paths (list): Output files or directories.
+    """
+    try:
+        os.makedirs(cache_dirpath, exist_ok=True)
+        outputs = _load_outputs(cache_dirpath)
+        outputs.update({os.path.abspath(path): {'key': key, 'fingerprint': fingerprint_file(path)}
+                        for path in output_paths})
+        outputs_path = os.path.join(cache_dirpath, OUTPUTS_FILENAME)
+        with open(outputs_path + '.tmp', 'w') as f:
+            json.dump(outputs, f, indent=2)
+        os.replace(outputs_path + '.tmp', outputs_path)
+    except Exception as e:
+        print(f"Error recording cached outputs: {e}")
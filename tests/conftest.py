@@ -0,0 +1,12 @@
+import os
+import sys
+import pytest
+
+# The pipeline modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logger_setup import configure_logging
+
+# Keep the pipeline's log records out of the repository's data_pipeline.log
+@pytest.fixture(autouse=True, scope='session')
+def temporary_log(tmp_path_factory):
+    configure_logging(log_filepath=str(tmp_path_factory.mktemp('logs') / 'data_pipeline.log'))
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etl_automation import CLEANED_SCHEMA, load_data, save_cleaned_data
+
+# Cleaned data over several months, with the gaps in the index that
+# clean_data leaves when it drops rows
+def cleaned_sample(rows=500):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'Transaction ID': np.arange(1, rows + 1),
+        'Date': pd.Timestamp('2023-01-01') + pd.to_timedelta(np.arange(rows) * 17 % 365, unit='D'),
+        'Customer ID': pd.array([f"CUST{i % 97:03d}" for i in range(rows)], dtype='string'),
+        'Gender': pd.Categorical(rng.choice(['Female', 'Male'], rows), categories=['Female', 'Male']),
+        'Age': rng.integers(18, 65, rows),
+        'Product Category': pd.Categorical(rng.choice(['Beauty', 'Clothing', 'Electronics'], rows),
+                                           categories=['Beauty', 'Clothing', 'Electronics']),
+        'Quantity': rng.integers(1, 5, rows),
+        'Price per Unit': rng.choice([25.0, 30.0, 50.0, 300.0, 500.0], rows),
+    })
+    df['Total Amount'] = df['Quantity'] * df['Price per Unit']
+    df = df.astype({column: dtype for column, dtype in CLEANED_SCHEMA.items() if dtype != 'category'})
+    return df.drop(index=df.index[::7])
+
+@pytest.mark.parametrize('compact', [False, True], ids=['plain', 'compact'])
+@pytest.mark.parametrize('file_extension', ['.pkl', '.feather', '.parquet'])
+def test_cleaned_data_round_trip(tmp_path, file_extension, compact):
+    df = cleaned_sample()
+    filepath = str(tmp_path / f"cleaned_data{file_extension}")
+    assert save_cleaned_data(df, filepath, compact=compact)
+
+    loaded = load_data(filepath)
+    if file_extension == '.pkl':
+        expected = df
+    else:
+        # Only Pickle keeps the index; Parquet returns its month partitions
+        # in Transaction ID order, which is the order they were written in
+        expected = df.reset_index(drop=True)
+    pd.testing.assert_frame_equal(loaded, expected)
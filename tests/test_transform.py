@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+from etl_automation import add_calendar_features
+
+# Helper with the original row-by-row season lookup
+def get_season(month):
+    if month in [12, 1, 2]:
+        return 'Winter'
+    elif month in [3, 4, 5]:
+        return 'Spring'
+    elif month in [6, 7, 8]:
+        return 'Summer'
+    else:
+        return 'Fall'
+
+# Helper computing the calendar columns the way transform_data originally did
+def reference_calendar_features(dates):
+    return pd.DataFrame({'Day of Week': dates.dt.day_name(),
+                         'Month': dates.dt.month,
+                         'Season': dates.dt.month.apply(get_season)})
+
+# Several years of days, including two leap years, plus the last second of
+# each day around leap days and season boundaries
+DAYS = pd.date_range('2019-12-01', '2025-03-31', freq='D')
+BOUNDARIES = pd.to_datetime([
+    '2020-02-28', '2020-02-29', '2020-03-01', '2021-02-28', '2021-03-01', '2024-02-29',
+    '2023-05-31', '2023-06-01', '2023-08-31', '2023-09-01', '2023-11-30', '2023-12-01',
+    '2023-12-31', '2024-01-01',
+])
+
+@pytest.mark.parametrize('dates', [
+    pd.Series(DAYS),
+    pd.Series(BOUNDARIES.append(BOUNDARIES + pd.Timedelta(hours=23, minutes=59, seconds=59))),
+    # Shuffled rows with a non-default index, as left behind by clean_data
+    pd.Series(DAYS).sample(frac=1, random_state=0).set_axis(range(5, 5 + len(DAYS))),
+], ids=['days', 'boundaries', 'shuffled'])
+def test_calendar_features_match_reference(dates):
+    df = add_calendar_features(pd.DataFrame({'Date': dates}))
+    expected = reference_calendar_features(dates)
+
+    for column in ('Day of Week', 'Season'):
+        assert isinstance(df[column].dtype, pd.CategoricalDtype)
+        pd.testing.assert_series_equal(df[column].astype(str), expected[column].astype(str), check_names=False)
+    pd.testing.assert_series_equal(df['Month'], expected['Month'], check_dtype=False, check_names=False)
+
+def test_leap_days_and_season_boundaries():
+    df = add_calendar_features(pd.DataFrame({'Date': pd.to_datetime(
+        ['2020-02-29', '2024-02-29', '2023-03-01', '2023-06-01', '2023-09-01', '2023-12-01'])}))
+    assert df['Day of Week'].tolist() == ['Saturday', 'Thursday', 'Wednesday', 'Thursday', 'Friday', 'Friday']
+    assert df['Season'].tolist() == ['Winter', 'Winter', 'Spring', 'Summer', 'Fall', 'Winter']
+
+def test_empty_frame():
+    df = add_calendar_features(pd.DataFrame({'Date': pd.Series([], dtype='datetime64[us]')}))
+    assert list(df.columns) == ['Date', 'Day of Week', 'Month', 'Season']
+    assert df.empty
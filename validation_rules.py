@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+# Number of offending Transaction IDs kept per rule in a validation report
+SAMPLE_SIZE = 5
+# Rule that needs the whole dataset, not one chunk, to be evaluated
+UNIQUE_ID_RULE = 'Transaction ID is unique'
+
+# Declarative validation rules.
+#
+# Each rule names the columns it needs and a vectorized check. Row rules
+# return a boolean Series that is True for valid rows; frame rules
+# ('scope': 'frame') return a single bool for the whole frame, e.g. dtype
+# checks. Row rule violations can be quarantined, frame rule violations
+# always fail validation.
+CLEANED_RULES = [
+    {'name': 'Transaction ID is integer', 'scope': 'frame', 'columns': ['Transaction ID'],
+     'check': lambda df: pd.api.types.is_integer_dtype(df['Transaction ID'])},
+    {'name': 'Date is datetime', 'scope': 'frame', 'columns': ['Date'],
+     'check': lambda df: pd.api.types.is_datetime64_any_dtype(df['Date'])},
+    {'name': 'Quantity is positive', 'columns': ['Quantity'],
+     'check': lambda df: df['Quantity'] > 0},
+    {'name': 'Price per Unit is positive', 'columns': ['Price per Unit'],
+     'check': lambda df: df['Price per Unit'] > 0},
+    {'name': 'Total Amount equals Quantity x Price per Unit', 'columns': ['Total Amount', 'Quantity', 'Price per Unit'],
+     'check': lambda df: pd.Series(np.isclose(df['Total Amount'], df['Quantity'] * df['Price per Unit']), index=df.index)},
+    # Duplicates are only detected within the frame (or chunk) being validated;
+    # etl_automation.check_unique_ids recounts them across chunks and files
+    {'name': UNIQUE_ID_RULE, 'columns': ['Transaction ID'],
+     'check': lambda df: ~df['Transaction ID'].duplicated(keep=False)},
+]
+
+TRANSFORMED_RULES = [
+    {'name': 'Revenue is non-negative', 'columns': ['Revenue'],
+     'check': lambda df: df['Revenue'] >= 0},
+    {'name': 'Season is a known season', 'columns': ['Season'],
+     'check': lambda df: df['Season'].isin(['Winter', 'Spring', 'Summer', 'Fall'])},
+]
+
+# Function to evaluate a set of rules over a DataFrame
+def evaluate_rules(df, rules, sample_size=SAMPLE_SIZE):
+    """
+    Evaluate every rule against df and report all violations.
+
+    Evaluation does not stop at the first failure: each rule is computed
+    once as a vectorized mask and the masks are combined to find every
+    invalid row.
+
+    Args:
+    - df (DataFrame): The data to validate.
+    - rules (list): Rule dicts, e.g. CLEANED_RULES.
+    - sample_size (int): Offending Transaction IDs to keep per rule.
+
+    Returns:
+    - tuple: (report dict, boolean numpy array that is True for rows
+      violating at least one row rule).
+    """
+    report, failures, _ = _evaluate(df, rules, sample_size)
+    return report, failures.any(axis=1)
+
+# Helper evaluating rules, also returning the per-row failure matrix
+def _evaluate(df, rules, sample_size):
+    report = {'rows': len(df), 'rules': {}}
+    row_masks = []
+    row_rule_names = []
+    for rule in rules:
+        missing = [column for column in rule['columns'] if column not in df.columns]
+        if missing:
+            report['rules'][rule['name']] = {'scope': 'frame', 'violations': max(len(df), 1),
+                                             'sample_ids': [], 'error': f"missing columns {missing}"}
+            continue
+
+        if rule.get('scope') == 'frame':
+            passed = bool(rule['check'](df))
+            report['rules'][rule['name']] = {'scope': 'frame', 'violations': 0 if passed else max(len(df), 1),
+                                             'sample_ids': [], 'error': None}
+        else:
+            row_masks.append(rule['check'](df).to_numpy(dtype=bool, na_value=False))
+            row_rule_names.append(rule['name'])
+
+    failures = np.zeros((len(df), 0), dtype=bool)
+    if row_masks:
+        failures = ~np.column_stack(row_masks)
+        ids = df['Transaction ID'].to_numpy() if 'Transaction ID' in df.columns else np.arange(len(df))
+        for name, rule_failures, count in zip(row_rule_names, failures.T, failures.sum(axis=0)):
+            report['rules'][name] = {'scope': 'row', 'violations': int(count),
+                                     'sample_ids': ids[rule_failures][:sample_size].tolist(), 'error': None}
+
+    report['invalid_rows'] = int(failures.any(axis=1).sum())
+    report['passed'] = all(result['violations'] == 0 for result in report['rules'].values())
+    return report, failures, row_rule_names
+
+# Function to combine reports from several chunks of the same dataset
+def merge_reports(total, report, sample_size=SAMPLE_SIZE):
+    """
+    Combine two validation reports, e.g. from consecutive chunks.
+
+    Args:
+    - total (dict or None): Report accumulated so far.
+    - report (dict): Report for the next chunk.
+    - sample_size (int): Offending Transaction IDs to keep per rule.
+
+    Returns:
+    - dict: The combined report.
+    """
+    if total is None:
+        return report
+
+    merged = {'rows': total['rows'] + report['rows'],
+              'invalid_rows': total['invalid_rows'] + report['invalid_rows'],
+              'rules': {}}
+    for name in total['rules'].keys() | report['rules'].keys():
+        empty = {'scope': 'row', 'violations': 0, 'sample_ids': [], 'error': None}
+        left, right = total['rules'].get(name, empty), report['rules'].get(name, empty)
+        merged['rules'][name] = {
+            'scope': left['scope'] if name in total['rules'] else right['scope'],
+            'violations': left['violations'] + right['violations'],
+            'sample_ids': (left['sample_ids'] + right['sample_ids'])[:sample_size],
+            'error': left['error'] or right['error'],
+        }
+    merged['passed'] = total['passed'] and report['passed']
+    return merged
+
+# Function to print a validation report
+def print_report(report, title):
+    """
+    Print every failed rule in a validation report.
+
+    Args:
+    - report (dict): Report from evaluate_rules or merge_reports.
+    - title (str): Name of the data that was validated.
+    """
+    if report['passed']:
+        print(f"{title} validation passed ({report['rows']} rows, {len(report['rules'])} rules).")
+        return
+
+    print(f"{title} validation found {report['invalid_rows']} invalid rows out of {report['rows']}:")
+    for name, result in sorted(report['rules'].items()):
+        if result['violations']:
+            if result['scope'] == 'frame':
+                detail = result['error'] or "check applies to the whole frame"
+            else:
+                detail = f"sample Transaction IDs {result['sample_ids']}"
+            print(f"  - {name}: {result['violations']} rows ({detail})")
+
+# Function to split off the rows that violate row rules
+def quarantine_invalid_rows(df, rules, title):
+    """
+    Validate df and separate the rows that break row rules, instead of
+    failing the whole run.
+
+    Frame rule failures (wrong dtypes, missing columns) cannot be fixed by
+    dropping rows, so they still fail validation.
+
+    Args:
+    - df (DataFrame): The data to validate.
+    - rules (list): Rule dicts, e.g. CLEANED_RULES.
+    - title (str): Name of the data, used when printing the report.
+
+    Returns:
+    - tuple: (valid rows, quarantined rows with a 'Failed Rules' column,
+      report), or (None, None, report) if a frame rule failed.
+    """
+    report, failures, names = _evaluate(df, rules, SAMPLE_SIZE)
+    print_report(report, title)
+    if any(result['scope'] == 'frame' and result['violations'] for result in report['rules'].values()):
+        return None, None, report
+
+    invalid = failures.any(axis=1)
+    quarantined = df[invalid].copy()
+    quarantined['Failed Rules'] = ['; '.join(name for name, failed in zip(names, row) if failed)
+                                   for row in failures[invalid]]
+    return df[~invalid], quarantined, report
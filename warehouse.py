@@ -0,0 +1,119 @@
+import sqlite3
+import time
+from contextlib import closing
+import pandas as pd
+
+# SQLite warehouse the analysis notebook reads from
+WAREHOUSE_DB_PATH = 'retail_data.db'
+WAREHOUSE_TABLE = 'retail_data'
+
+# Rows per executemany call; all batches share one transaction
+DEFAULT_BATCH_SIZE = 50_000
+
+# Column types of the warehouse table, in the order of the transformed data
+WAREHOUSE_COLUMNS = {
+    'Transaction ID': 'INTEGER PRIMARY KEY',
+    'Date': 'TEXT',
+    'Customer ID': 'TEXT',
+    'Gender': 'TEXT',
+    'Age': 'INTEGER',
+    'Product Category': 'TEXT',
+    'Quantity': 'INTEGER',
+    'Price per Unit': 'REAL',
+    'Total Amount': 'REAL',
+    'Day of Week': 'TEXT',
+    'Month': 'INTEGER',
+    'Season': 'TEXT',
+    'Revenue': 'REAL',
+}
+
+# Columns that filtered KPI queries look up by
+INDEXED_COLUMNS = ['Date', 'Customer ID', 'Product Category']
+
+# Pragmas for bulk loading: WAL lets readers carry on during the load and
+# NORMAL sync is still safe in WAL mode
+LOAD_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-262144",  # 256 MB page cache
+]
+
+# Function to quote a table or column name for SQL
+def quote_identifier(column):
+    return '"' + column.replace('"', '""') + '"'
+
+# Function to create the warehouse table and its indexes
+def create_warehouse_table(conn, table=WAREHOUSE_TABLE):
+    """
+    Create the warehouse table and its indexes if they do not exist.
+
+    Tables created by the notebook's df.to_sql have no primary key, so a
+    unique index on Transaction ID is added to them to allow upserts.
+
+    Args:
+    - conn (Connection): Open warehouse connection.
+    - table (str): Table name.
+    """
+    columns = ', '.join(f"{quote_identifier(column)} {sql_type}" for column, sql_type in WAREHOUSE_COLUMNS.items())
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {quote_identifier(table)} ({columns})")
+
+    has_primary_key = any(row[5] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})"))
+    if not has_primary_key:
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {quote_identifier('idx_' + table + '_transaction_id')} "
+                     f"ON {quote_identifier(table)} ({quote_identifier('Transaction ID')})")
+    for column in INDEXED_COLUMNS:
+        index_name = 'idx_' + table + '_' + column.lower().replace(' ', '_')
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier(index_name)} ON {quote_identifier(table)} ({quote_identifier(column)})")
+
+# Helper converting a DataFrame into column lists of plain Python values
+def _column_values(df, columns):
+    values = []
+    for column in columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            # Same text format as df.to_sql, so both loaders produce comparable dates
+            series = series.dt.strftime('%Y-%m-%d %H:%M:%S')
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(series.cat.categories.dtype)
+        values.append(series.astype(object).where(series.notna(), None).tolist())
+    return values
+
+# Function to bulk load transformed data into the warehouse
+def load_to_warehouse(df, db_path=WAREHOUSE_DB_PATH, table=WAREHOUSE_TABLE, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Upsert transformed data into the SQLite warehouse.
+
+    Rows are inserted with batched executemany calls inside a single
+    transaction; a row whose Transaction ID is already stored replaces the
+    stored values, so reloading data never duplicates or drops rows.
+
+    Args:
+    - df (DataFrame): Transformed data.
+    - db_path (str): Warehouse database path.
+    - table (str): Table name.
+    - batch_size (int): Rows per executemany call.
+
+    Returns:
+    - int: Number of rows upserted, or None if the load failed.
+    """
+    start_time = time.perf_counter()
+    columns = [column for column in WAREHOUSE_COLUMNS if column in df.columns]
+    quoted = [quote_identifier(column) for column in columns]
+    updates = ', '.join(f"{column} = excluded.{column}" for column in quoted if column != quote_identifier('Transaction ID'))
+    statement = (f"INSERT INTO {quote_identifier(table)} ({', '.join(quoted)}) VALUES ({', '.join('?' * len(columns))}) "
+                 f"ON CONFLICT ({quote_identifier('Transaction ID')}) DO UPDATE SET {updates}")
+    try:
+        with closing(sqlite3.connect(db_path)) as conn:
+            for pragma in LOAD_PRAGMAS:
+                conn.execute(pragma)
+            with conn:
+                create_warehouse_table(conn, table)
+                for start in range(0, len(df), batch_size):
+                    batch = df.iloc[start:start + batch_size]
+                    conn.executemany(statement, zip(*_column_values(batch, columns)))
+        print(f"Loaded {len(df)} rows into {db_path} in {time.perf_counter() - start_time:.2f}s.")
+        return len(df)
+    except Exception as e:
+        print(f"Error loading data into the warehouse: {e}")
+        return None
@@ -0,0 +1,221 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+import pandas as pd
+from warehouse import WAREHOUSE_DB_PATH, WAREHOUSE_TABLE, WAREHOUSE_COLUMNS, quote_identifier
+
+# Read connections kept open per database; each one caches the prepared
+# statements of the queries run on it
+POOL_SIZE = 4
+STATEMENT_CACHE_SIZE = 256
+
+# Rows fetched per batch when streaming query results
+DEFAULT_FETCH_SIZE = 10_000
+
+# Aggregations that can be pushed down to SQL
+AGGREGATES = {'sum': 'SUM', 'mean': 'AVG', 'count': 'COUNT', 'min': 'MIN', 'max': 'MAX'}
+
+# Derived dimensions computed in SQL from the stored Date text
+DERIVED_DIMENSIONS = {
+    'Sales Month': 'substr("Date", 1, 7)',
+    'Year': 'CAST(substr("Date", 1, 4) AS INTEGER)',
+}
+
+# Open connection pools, keyed by database path
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Helper opening a read-only warehouse connection
+def _open_connection(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+# Function to borrow a pooled read connection
+@contextmanager
+def pooled_connection(db_path=WAREHOUSE_DB_PATH):
+    """
+    Borrow a read-only connection to the warehouse, opening one only when
+    the pool is empty. The connection is returned to the pool afterwards,
+    so repeated queries reuse both the connection and its prepared
+    statements.
+
+    Args:
+    - db_path (str): Warehouse database path.
+
+    Yields:
+    - Connection: A read-only sqlite3 connection.
+    """
+    with _pools_lock:
+        pool = _pools.setdefault(db_path, queue.LifoQueue(maxsize=POOL_SIZE))
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection(db_path)
+    try:
+        yield conn
+    finally:
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+# Function to close every pooled connection
+def close_pools():
+    """
+    Close all pooled connections, e.g. before the warehouse is replaced.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        while not pool.empty():
+            pool.get_nowait().close()
+
+# Function to stream query results in batches
+def iter_query(sql, params=(), db_path=WAREHOUSE_DB_PATH, fetch_size=DEFAULT_FETCH_SIZE):
+    """
+    Run a query and yield its result in DataFrame batches, so large results
+    never have to be held in memory at once.
+
+    Args:
+    - sql (str): Query with ? placeholders.
+    - params (sequence): Query parameters.
+    - db_path (str): Warehouse database path.
+    - fetch_size (int): Rows per batch.
+
+    Yields:
+    - DataFrame: The next batch of rows.
+    """
+    with pooled_connection(db_path) as conn:
+        cursor = conn.execute(sql, tuple(params))
+        try:
+            columns = [description[0] for description in cursor.description]
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield pd.DataFrame.from_records(rows, columns=columns)
+        finally:
+            cursor.close()
+
+# Function to run a query and return its whole result
+def run_query(sql, params=(), db_path=WAREHOUSE_DB_PATH):
+    """
+    Run a query on a pooled connection.
+
+    Args:
+    - sql (str): Query with ? placeholders.
+    - params (sequence): Query parameters.
+    - db_path (str): Warehouse database path.
+
+    Returns:
+    - DataFrame: The query result.
+    """
+    with pooled_connection(db_path) as conn:
+        cursor = conn.execute(sql, tuple(params))
+        columns = [description[0] for description in cursor.description]
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
+# Helper returning the SQL expression of a column or derived dimension
+def _column_sql(column):
+    if column in DERIVED_DIMENSIONS:
+        return DERIVED_DIMENSIONS[column]
+    if column not in WAREHOUSE_COLUMNS:
+        raise ValueError(f"Unknown warehouse column: {column}")
+    return quote_identifier(column)
+
+# Helper building the WHERE clause of a query
+def _where_clause(start=None, end=None, filters=None):
+    conditions = []
+    params = []
+    # Compare the Date text directly so the Date index is used
+    if start is not None:
+        conditions.append('"Date" >= ?')
+        params.append(pd.Timestamp(start).strftime('%Y-%m-%d %H:%M:%S'))
+    if end is not None:
+        conditions.append('"Date" < ?')
+        params.append(pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S'))
+    for column, value in (filters or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(f"{_column_sql(column)} IN ({', '.join('?' * len(value))})")
+            params.extend(value)
+        else:
+            conditions.append(f"{_column_sql(column)} = ?")
+            params.append(value)
+    clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+    return clause, params
+
+# Function to aggregate warehouse data in SQL
+def aggregate(by, measure='Total Amount', agg='sum', start=None, end=None, filters=None,
+              top=None, db_path=WAREHOUSE_DB_PATH, table=WAREHOUSE_TABLE):
+    """
+    Group, filter and aggregate in SQL, returning only the aggregated rows.
+
+    Args:
+    - by (str or list): Grouping column(s); 'Sales Month' and 'Year' are
+      derived from Date.
+    - measure (str): Column to aggregate.
+    - agg (str): One of 'sum', 'mean', 'count', 'min', 'max'.
+    - start (datetime-like, optional): Earliest Date (inclusive).
+    - end (datetime-like, optional): Latest Date (exclusive).
+    - filters (dict, optional): Column to value, or list of values.
+    - top (int, optional): Only return the top groups by the aggregate.
+    - db_path (str): Warehouse database path.
+    - table (str): Table name.
+
+    Returns:
+    - DataFrame: One row per group with the grouping columns and measure.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    if agg not in AGGREGATES:
+        raise ValueError(f"Unsupported aggregation: {agg}")
+
+    select = [f"{_column_sql(column)} AS {quote_identifier(column)}" for column in by]
+    select.append(f"{AGGREGATES[agg]}({_column_sql(measure)}) AS {quote_identifier(measure)}")
+    where, params = _where_clause(start, end, filters)
+    sql = f"SELECT {', '.join(select)} FROM {quote_identifier(table)}{where}"
+    if by:
+        sql += f" GROUP BY {', '.join(quote_identifier(column) for column in by)}"
+    if top is not None:
+        sql += f" ORDER BY {quote_identifier(measure)} DESC LIMIT ?"
+        params.append(int(top))
+    elif by:
+        sql += f" ORDER BY {', '.join(quote_identifier(column) for column in by)}"
+    return run_query(sql, params, db_path)
+
+# Analysis notebook KPIs answered in SQL
+
+def monthly_revenue_by_category(year=None, db_path=WAREHOUSE_DB_PATH):
+    """
+    Total sales per month and product category, optionally for one year.
+
+    Returns:
+    - DataFrame: Indexed by Sales Month, one column per product category.
+    """
+    start, end = (f"{year}-01-01", f"{int(year) + 1}-01-01") if year is not None else (None, None)
+    df = aggregate(['Sales Month', 'Product Category'], start=start, end=end, db_path=db_path)
+    return df.pivot(index='Sales Month', columns='Product Category', values='Total Amount').fillna(0)
+
+def sales_by(dimension, measure='Total Amount', agg='sum', start=None, end=None, db_path=WAREHOUSE_DB_PATH):
+    """
+    Aggregate of a measure per value of one dimension, e.g. sales by
+    'Season', 'Gender' or 'Product Category'.
+
+    Returns:
+    - Series: The aggregate indexed by dimension value.
+    """
+    df = aggregate(dimension, measure, agg, start=start, end=end, db_path=db_path)
+    return df.set_index(dimension)[measure]
+
+def top_customers(n=10, start=None, end=None, db_path=WAREHOUSE_DB_PATH):
+    """
+    The n customers with the highest total spend.
+
+    Returns:
+    - Series: Total Amount indexed by Customer ID, highest first.
+    """
+    df = aggregate('Customer ID', top=n, start=start, end=end, db_path=db_path)
+    return df.set_index('Customer ID')['Total Amount']